@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конвертера CTF writeup'ів
+Генерує синтетичний репозиторій writeup'ів і вимірює кожен етап конвеєра
+(пошук задач, вбудовування зображень, markdown → HTML, друк у Chromium,
+об'єднання PDF). Результат - JSON з часом, пропускною здатністю та пам'яттю.
+
+Працює офлайн з локально встановленим Chromium (playwright install chromium).
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+import get_ctf
+from get_ctf import CTFWriteupConverter, peak_rss_mb
+
+
+CATEGORY_NAMES = ['forensics', 'crypto', 'web', 'pwn', 'reverse', 'misc', 'hardware']
+
+CODE_SNIPPET = """from pwn import *
+
+io = remote('challenge.ctf', 1337)
+payload = b'A' * 72 + p64(0x401196)
+io.sendlineafter(b'> ', payload)
+print(io.recvall().decode())
+"""
+
+PARAGRAPH = (
+    "The binary reads user input into a fixed-size stack buffer without bounds checking, "
+    "so we can overwrite the saved return address and redirect execution to the win function. "
+)
+
+
+def draw_screenshot(width, height, rng):
+    """Малює зображення, схоже на скріншот терміналу: рядки тексту на темному фоні"""
+    image = Image.new('RGB', (width, height), (30, 30, 36))
+    draw = ImageDraw.Draw(image)
+    line_height = max(12, height // 60)
+    for y in range(line_height, height - line_height, line_height + 4):
+        x = 20
+        while x < width - 40:
+            word = rng.randint(20, 160)
+            color = rng.choice([(220, 220, 220), (120, 200, 120), (230, 120, 110), (110, 160, 230)])
+            draw.rectangle((x, y, min(x + word, width - 20), y + line_height - 4), fill=color)
+            x += word + rng.randint(8, 30)
+    return image
+
+
+def generate_repo(root, categories=3, challenges=10, readme_kb=8, code_blocks=4,
+                  images=2, image_width=1920, image_height=1080, seed=0):
+    """Створює синтетичний репозиторій: categories × challenges задач з README.md та assets/"""
+    rng = random.Random(seed)
+    root = Path(root)
+
+    for category in CATEGORY_NAMES[:categories] + [f"category{i}" for i in range(len(CATEGORY_NAMES), categories)]:
+        for number in range(challenges):
+            challenge_dir = root / category / f"Challenge {number}"
+            assets_dir = challenge_dir / "assets"
+            assets_dir.mkdir(parents=True, exist_ok=True)
+
+            parts = [f"# Challenge {number}\n\n## Опис\n\n"]
+            for image_number in range(images):
+                image_path = assets_dir / f"{image_number + 1}.png"
+                draw_screenshot(image_width, image_height, rng).save(image_path)
+                parts.append(f"![screenshot {image_number + 1}](assets/{image_path.name})\n\n")
+
+            for block in range(code_blocks):
+                parts.append(f"### Крок {block + 1}\n\n```python\n{CODE_SNIPPET}```\n\n")
+
+            text = ''.join(parts)
+            while len(text.encode('utf-8')) < readme_kb * 1024:
+                text += PARAGRAPH * 4 + "\n\n"
+
+            (challenge_dir / "README.md").write_text(text, encoding='utf-8')
+
+    return root
+
+
+class StageTimer:
+    """Вимірює час, пікову пам'ять процесу (RSS) та кількість елементів етапу.
+
+    tracemalloc тут не вмикається: він сповільнює Python код у рази і спотворює час.
+    Пам'ять береться з ru_maxrss - це пік усього процесу, тож для етапу видно,
+    наскільки він підняв пік (rss_growth_mb). Пам'ять Chromium (окремі процеси) не враховується.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def measure(self, name, items=0, size_bytes=0):
+        timer = self
+
+        class Stage:
+            def __enter__(self):
+                self.rss_before = peak_rss_mb()
+                self.started = time.perf_counter()
+                self.items = items
+                self.size_bytes = size_bytes
+                return self
+
+            def __exit__(self, *exc_info):
+                elapsed = time.perf_counter() - self.started
+                rss_after = peak_rss_mb()
+                timer.stages[name] = {
+                    'seconds': round(elapsed, 4),
+                    'items': self.items,
+                    'items_per_second': round(self.items / elapsed, 2) if elapsed and self.items else None,
+                    'mb_per_second': round(self.size_bytes / elapsed / 1e6, 2) if elapsed and self.size_bytes else None,
+                    'peak_rss_mb': round(rss_after, 1) if rss_after is not None else None,
+                    'rss_growth_mb': round(rss_after - self.rss_before, 1) if rss_after is not None else None,
+                }
+                return False
+
+        return Stage()
+
+
+async def run_benchmark(repo_path, output_dir, jobs=1, merge_mode='memory', asset_mode='inline',
+                        image_dpi=150, skip_browser=False, backend='chromium'):
+    """Проганяє всі етапи конвеєра окремо і повертає словник з результатами"""
+    converter = CTFWriteupConverter(
+        repo_path, output_dir, jobs=jobs, use_cache=False, image_dpi=image_dpi,
+        asset_mode=asset_mode, merge_mode=merge_mode, discovery_cache=False, backend=backend
+    )
+    timer = StageTimer()
+
+    with timer.measure('discovery') as stage:
+        challenges = converter.find_challenge_folders()
+        stage.items = len(challenges)
+
+    sources = [converter.build_challenge_markdown(challenge) for challenge in challenges]
+
+    # base64 зображень підставляється вже в HTML, як і в конвеєрі конвертера
+    data_urls = [[] for _ in challenges]
+    with timer.measure('image_inlining', items=len(challenges)) as stage:
+        processed = [
+            converter.process_images_in_markdown(markdown_content, challenge['path'] / 'assets', data_urls=urls)
+            for challenge, markdown_content, urls in zip(challenges, sources, data_urls)
+        ]
+        stage.size_bytes = sum(len(markdown_content) + sum(map(len, urls))
+                               for markdown_content, urls in zip(processed, data_urls))
+
+    with timer.measure('markdown_to_html', items=len(challenges)) as stage:
+        documents = [
+            converter.inline_data_urls(html_content, urls)
+            for html_content, urls in zip(converter.renderer.render_many(processed), data_urls)
+        ]
+        stage.size_bytes = sum(len(html_content) for html_content in documents)
+
+    if not skip_browser:
+        output_paths = [converter.output_path_for(challenge) for challenge in challenges]
+        print_stage = 'chromium_print' if backend == 'chromium' else f'{backend}_print'
+        with timer.measure(print_stage, items=len(challenges)) as stage:
+            async with converter.browser_session() as browser:
+                semaphore = asyncio.Semaphore(converter.jobs)
+
+                async def print_one(html_content, output_path):
+                    async with semaphore:
+                        await converter._print_html_to_pdf(browser, html_content, output_path)
+
+                await asyncio.gather(*(
+                    print_one(html_content, output_path)
+                    for html_content, output_path in zip(documents, output_paths)
+                ))
+            stage.size_bytes = sum(path.stat().st_size for path in output_paths)
+
+        converter.generated_pdfs = output_paths
+        if get_ctf.MERGE_AVAILABLE:
+            with timer.measure('merge', items=len(output_paths)) as stage:
+                converter.merge_pdfs()
+                merged_path = converter.output_dir / "ALL_WRITEUPS_MERGED.pdf"
+                stage.size_bytes = merged_path.stat().st_size if merged_path.exists() else 0
+
+    return {
+        'challenges': len(challenges),
+        'settings': {
+            'jobs': jobs,
+            'merge_mode': merge_mode,
+            'asset_mode': converter.asset_mode,
+            'backend': backend,
+            'image_dpi': image_dpi,
+        },
+        'stages': timer.stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in timer.stages.values()), 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+    }
+
+
+def parse_args(argv=None):
+    """Розбирає аргументи командного рядка"""
+    parser = argparse.ArgumentParser(description="Бенчмарк конвертера CTF writeup'ів на синтетичному репозиторії")
+    parser.add_argument('--categories', type=int, default=3, help="кількість категорій")
+    parser.add_argument('--challenges', type=int, default=10, help="задач у кожній категорії")
+    parser.add_argument('--readme-kb', type=int, default=8, help="розмір README.md у КБ")
+    parser.add_argument('--code-blocks', type=int, default=4, help="блоків коду в кожному README")
+    parser.add_argument('--images', type=int, default=2, help="зображень у кожній задачі")
+    parser.add_argument('--image-size', default='1920x1080', help="роздільність зображень, ШxВ")
+    parser.add_argument('--seed', type=int, default=0, help="зерно генератора випадкових чисел")
+    parser.add_argument('--repo', help="використати (або згенерувати) репозиторій у цій папці замість тимчасової")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="сторінок Chromium одночасно")
+    parser.add_argument('--merge-mode', choices=['memory', 'stream'], default='memory')
+    parser.add_argument('--assets', choices=['inline', 'file'], default='inline')
+    parser.add_argument('--image-dpi', type=int, default=150)
+    parser.add_argument('--backend', choices=['chromium', 'reportlab'], default='chromium',
+                        help="чим друкувати PDF (reportlab не потребує Chromium)")
+    parser.add_argument('--skip-browser', action='store_true', help="не запускати Chromium (лише CPU етапи)")
+    parser.add_argument('--output', help="записати JSON у файл замість stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        args.image_width, args.image_height = (int(value) for value in args.image_size.lower().split('x'))
+    except ValueError:
+        parser.error("--image-size має бути у форматі ШИРИНАxВИСОТА, наприклад 1920x1080")
+
+    return args
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ctf_bench_") as temp_dir:
+        repo_path = Path(args.repo) if args.repo else Path(temp_dir) / "repo"
+        if not repo_path.exists():
+            generate_repo(
+                repo_path, categories=args.categories, challenges=args.challenges,
+                readme_kb=args.readme_kb, code_blocks=args.code_blocks, images=args.images,
+                image_width=args.image_width, image_height=args.image_height, seed=args.seed
+            )
+
+        # Прогрес конвертера йде в stderr, щоб stdout містив лише JSON
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            report = asyncio.run(run_benchmark(
+                repo_path, Path(temp_dir) / "out", jobs=args.jobs, merge_mode=args.merge_mode,
+                asset_mode=args.assets, image_dpi=args.image_dpi, skip_browser=args.skip_browser,
+                backend=args.backend
+            ))
+        finally:
+            sys.stdout = stdout
+
+    report['generator'] = {
+        'categories': args.categories,
+        'challenges_per_category': args.challenges,
+        'readme_kb': args.readme_kb,
+        'code_blocks': args.code_blocks,
+        'images': args.images,
+        'image_size': [args.image_width, args.image_height],
+        'seed': args.seed,
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,159 +7,125 @@ CTF Writeups to PDF Converter (Playwright version with PDF merging)
 
 import os
 import sys
+import argparse
 import subprocess
 import shutil
 from pathlib import Path
 import tempfile
 import markdown
-from PIL import Image
+from markdown.preprocessors import Preprocessor
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from PIL import Image, ImageOps
+import pygments
 import base64
 import io
 import re
+import fnmatch
+import html
+from html.parser import HTMLParser
+import json
+import urllib.parse
+import urllib.request
+import hashlib
 import asyncio
-from playwright.async_api import async_playwright
+import contextlib
+import collections
+import itertools
+import cProfile
+import pstats
+import tracemalloc
+import time
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:  # Бекенд reportlab працює без Chromium
+    async_playwright = None
 
 try:
     from PyPDF2 import PdfReader, PdfWriter
+    from PyPDF2.generic import (
+        ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject
+    )
     from reportlab.pdfgen import canvas
     from reportlab.lib.pagesizes import A4
     from reportlab.lib.units import cm
     from reportlab.pdfbase import pdfmetrics
     from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab import platypus
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.utils import ImageReader
 
     MERGE_AVAILABLE = True
 except ImportError:
     MERGE_AVAILABLE = False
 
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
 
-class CTFWriteupConverter:
-    def __init__(self, repo_path, output_dir="pdf_writeups"):
-        self.repo_path = Path(repo_path)
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
-        self.generated_pdfs = []  # Список згенерованих PDF файлів
-
-    def find_challenge_folders(self):
-        """Знаходить всі папки з задачами (які містять README.md)"""
-        challenges = []
-
-        # Перевіряємо чи передали шлях до конкретної категорії (наприклад forensics)
-        if self.repo_path.name in ['forensics', 'crypto', 'web', 'pwn', 'reverse', 'misc', 'hardware']:
-            # Це конкретна категорія, шукаємо задачі безпосередньо в ній
-            category_name = self.repo_path.name
-            for challenge_path in self.repo_path.iterdir():
-                if challenge_path.is_dir() and not challenge_path.name.startswith('.'):
-                    readme_path = challenge_path / "README.md"
-                    if readme_path.exists():
-                        challenges.append({
-                            'category': category_name,
-                            'name': challenge_path.name,
-                            'path': challenge_path,
-                            'readme': readme_path
-                        })
-        else:
-            # Це кореневий репозиторій, шукаємо у всіх категоріях
-            for category_path in self.repo_path.iterdir():
-                if category_path.is_dir() and not category_path.name.startswith('.'):
-                    # Перевіряємо чи є підпапки з задачами
-                    for challenge_path in category_path.iterdir():
-                        if challenge_path.is_dir():
-                            readme_path = challenge_path / "README.md"
-                            if readme_path.exists():
-                                challenges.append({
-                                    'category': category_path.name,
-                                    'name': challenge_path.name,
-                                    'path': challenge_path,
-                                    'readme': readme_path
-                                })
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
 
-        return challenges
+try:
+    import resource  # Немає на Windows
+except ImportError:
+    resource = None
 
-    def process_images_in_markdown(self, markdown_content, assets_dir):
-        """Обробляє зображення в markdown, конвертує їх в base64"""
-        if not assets_dir.exists():
-            return markdown_content
+# Версія конвертера: входить у ключ кешу збірки, тому її варто змінювати
+# при будь-яких змінах, що впливають на вигляд PDF
+CONVERTER_VERSION = "1.1"
 
-        def replace_image(match):
-            alt_text = match.group(1) if match.group(1) else ""
-            img_path = match.group(2)
+# Файл з ключами вже зібраних PDF (лежить у папці результатів)
+BUILD_MANIFEST_NAME = ".build_manifest.json"
 
-            print(f"🔍 Обробляю зображення: {img_path}")
+# Журнал задач, готових у поточному запуску: після переривання наступний запуск продовжує з нього
+BUILD_JOURNAL_NAME = ".build_journal.jsonl"
 
-            # Варіанти шляхів для пошуку зображення
-            possible_paths = []
+# Коміт репозиторію, з якого зроблено останню збірку (режим --git-changes)
+LAST_BUILD_COMMIT_NAME = ".last_build_commit.json"
 
-            # 1. Якщо це відносний шлях до assets
-            if img_path.startswith('assets/') or img_path.startswith('./assets/'):
-                img_name = img_path.split('/')[-1]
-                possible_paths.append(assets_dir / img_name)
+# Звіт про задачі, які не вдалося зібрати навіть після повторних спроб
+FAILURE_REPORT_NAME = "failures.json"
 
-            # 2. Якщо це просто назва файлу (без папки)
-            elif '/' not in img_path:
-                possible_paths.append(assets_dir / img_path)
+# Назви папок, які вважаються категоріями, якщо передано шлях прямо до них
+KNOWN_CATEGORIES = ['forensics', 'crypto', 'web', 'pwn', 'reverse', 'misc', 'hardware']
 
-            # 3. Якщо це повний відносний шлях
-            else:
-                # Спробуємо взяти тільки назву файлу
-                img_name = img_path.split('/')[-1]
-                possible_paths.append(assets_dir / img_name)
+# Кеш дерева папок для повторних запусків (лежить у папці результатів)
+DISCOVERY_CACHE_NAME = ".discovery_cache.json"
 
-                # Також спробуємо повний шлях відносно папки задачі
-                challenge_path = assets_dir.parent
-                possible_paths.append(challenge_path / img_path)
+# Папка з томами об'єднаного PDF (--split-by)
+VOLUMES_DIR_NAME = "volumes"
 
-            # Шукаємо файл у всіх можливих місцях
-            for full_img_path in possible_paths:
-                if full_img_path.exists():
-                    try:
-                        print(f"✅ Знайдено зображення: {full_img_path}")
-
-                        # Конвертуємо зображення в base64
-                        with open(full_img_path, 'rb') as img_file:
-                            img_data = img_file.read()
-
-                        # Визначаємо MIME тип
-                        ext = full_img_path.suffix.lower()
-                        mime_types = {
-                            '.png': 'image/png',
-                            '.jpg': 'image/jpeg',
-                            '.jpeg': 'image/jpeg',
-                            '.gif': 'image/gif',
-                            '.svg': 'image/svg+xml',
-                            '.webp': 'image/webp'
-                        }
-                        mime_type = mime_types.get(ext, 'image/png')
-
-                        # Створюємо base64 data URL
-                        base64_data = base64.b64encode(img_data).decode('utf-8')
-                        return f'![{alt_text}](data:{mime_type};base64,{base64_data})'
+# Карта розділів об'єднаного PDF для інкрементного оновлення (сторінки кожного writeup'а)
+MERGE_MAP_NAME = ".merged_map.json"
+# Скільки останніх байтів цілісної версії PDF зберігає карта (щоб упізнати її після перерваного дописування)
+MERGE_TAIL_BYTES = 64
 
-                    except Exception as e:
-                        print(f"❌ Помилка обробки зображення {full_img_path}: {e}")
-                        continue
+# Частка мертвих (замінених) даних у файлі, після якої PDF перезаписується повністю
+MERGE_GARBAGE_LIMIT = 0.5
 
-            print(f"⚠️  Зображення не знайдено: {img_path}")
-            return match.group(0)  # Повертаємо оригінальний текст якщо не знайшли
+# Markdown зображення: ![alt](шлях)
+IMAGE_PATTERN = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
 
-        # Знаходимо всі markdown зображення
-        img_pattern = r'!\[([^\]]*)\]\(([^)]+)\)'
-        processed_content = re.sub(img_pattern, replace_image, markdown_content)
+# Заголовок у посиланні на зображення: ![alt](path "title")
+IMAGE_TITLE_PATTERN = re.compile(r'\s+(?:"[^"]*"|\'[^\']*\')\s*$')
 
-        return processed_content
+# Замість base64 у markdown ставиться коротка мітка, а data: URL підставляється вже в HTML:
+# інакше Markdown проганяє свої регулярні вирази по мегабайтах base64
+INLINE_IMAGE_PLACEHOLDER = "ctf-inline-image:"
+INLINE_IMAGE_PATTERN = re.compile(r'src="ctf-inline-image:(\d+)"')
 
-    def markdown_to_html(self, markdown_content):
-        """Конвертує markdown в HTML з підтримкою синтаксису коду"""
-        md = markdown.Markdown(extensions=[
-            'codehilite',
-            'fenced_code',
-            'tables',
-            'toc'
-        ])
+# Теги в розмітці абзацу reportlab (щоб відрізнити порожній абзац від абзацу з текстом)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
 
-        html_content = md.convert(markdown_content)
-
-        # Додаємо CSS стилі для гарного відображення
-        css_styles = """
+# CSS стилі для гарного відображення
+CSS_STYLES = """
         <style>
         @page {
             size: A4;
@@ -275,65 +241,1651 @@ class CTFWriteupConverter:
         </style>
         """
 
-        return f"""
+# Додаткові стилі для режиму книги (вся колекція в одному HTML документі)
+BOOK_CSS_STYLES = """
+        <style>
+        .book-separator {
+            page-break-before: always;
+            page-break-after: always;
+            padding-top: 35vh;
+            text-align: center;
+        }
+
+        .book-separator h1 {
+            display: inline-block;
+            border-bottom: 2px solid #334d80;
+            color: #334d80;
+            font-size: 32px;
+        }
+        </style>
+        """
+
+# Нижній колонтитул книги з номером сторінки
+BOOK_FOOTER_TEMPLATE = (
+    '<div style="width: 100%; font-size: 9px; color: #7f8c8d; text-align: center;">'
+    '<span class="pageNumber"></span></div>'
+)
+
+# Відкриваючі та закриваючі теги заголовків у HTML
+HEADING_TAG_PATTERN = re.compile(r'<(/?)h([1-6])\b')
+
+# Додаткові стилі статичного сайту (--engine html): читабельна ширина та навігація
+SITE_CSS_STYLES = """
+        body {
+            max-width: 900px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+
+        .site-nav {
+            margin-bottom: 20px;
+            font-size: 13px;
+        }
+
+        .site-nav a, .site-index a {
+            color: #3498db;
+            text-decoration: none;
+        }
+
+        .site-filter {
+            width: 100%;
+            padding: 8px;
+            font-size: 14px;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+        }
+"""
+
+SITE_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>{title}</title>
+    <link rel="stylesheet" href="style.css">
+</head>
+<body>
+{nav}
+{body}
+</body>
+</html>
+"""
+
+# Фільтр списку задач на сторінці індексу сайту
+SITE_FILTER_SCRIPT = """
+<input class="site-filter" type="search" placeholder="Пошук задачі..." autofocus>
+<script>
+document.querySelector('.site-filter').addEventListener('input', function (event) {
+    var query = event.target.value.toLowerCase();
+    document.querySelectorAll('.site-index li').forEach(function (item) {
+        item.style.display = item.textContent.toLowerCase().indexOf(query) === -1 ? 'none' : '';
+    });
+});
+</script>
+"""
+
+# MIME типи зображень за розширенням файлу
+MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.svg': 'image/svg+xml',
+    '.webp': 'image/webp'
+}
+
+# Ширина області друку: A4 (21 см) мінус поля по 2 см
+PRINTABLE_WIDTH_CM = 21 - 2 * 2
+
+# EXIF тег орієнтації (1 - без повороту)
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Віртуальна адреса, з якої Chromium отримує документ прямо з пам'яті (без тимчасових файлів).
+# Локальні зображення (asset_mode='file') віддаються за адресою VIRTUAL_ORIGIN/__file__/<шлях>.
+VIRTUAL_ORIGIN = "http://ctf-writeup.local"
+VIRTUAL_FILE_PREFIX = "/__file__"
+FILE_SRC_PATTERN = re.compile(r'src="file://([^"]*)"')
+
+# Етапи, час яких вимірюється для кожної задачі (у порядку конвеєра)
+STATS_STAGES = ['read', 'images', 'markdown', 'goto', 'pdf', 'merge']
+
+# Unix сокет сервера конвертації за замовчуванням
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "get_ctf.sock")
+
+# Максимальна довжина JSON заголовка повідомлення сервера (довгі списки задач);
+# великі дані (markdown, PDF) передаються окремо після заголовка
+MESSAGE_LINE_LIMIT = 16 * 1024 * 1024
+
+# Блоки коду, більші за цей розмір (КБ), не підсвічуються
+DEFAULT_HIGHLIGHT_LIMIT_KB = 128
+
+
+class ImageOptimizer:
+    """Зменшує та перестискає зображення під ширину сторінки з кешем на диску.
+
+    Результат кешується у cache_dir за хешем вихідного файлу та налаштувань,
+    тому кожен скріншот обробляється лише один раз.
+    """
+
+    # Формати, які не чіпаємо (вектор та анімації)
+    PASSTHROUGH_SUFFIXES = {'.svg', '.gif'}
+    # Можливі файли кешу для одного зображення (.orig - перестискання нічого не дало)
+    CACHE_SUFFIXES = ('.png', '.jpg', '.webp', '.orig')
+
+    def __init__(self, cache_dir, dpi=150, image_format='auto', quality=85):
+        self.cache_dir = Path(cache_dir)
+        self.dpi = dpi
+        self.image_format = image_format
+        self.quality = quality
+        self.max_width = int(PRINTABLE_WIDTH_CM / 2.54 * dpi)
+
+    def settings_key(self):
+        """Рядок з налаштуваннями, що впливають на результат"""
+        return f"dpi={self.dpi};format={self.image_format};quality={self.quality};orientation=exif"
+
+    def choose_format(self, suffix):
+        """Обирає формат збереження: JPEG/WebP для фото, оптимізований PNG для скріншотів"""
+        if self.image_format != 'auto':
+            return self.image_format
+        if suffix in ('.jpg', '.jpeg'):
+            return 'jpeg'
+        if suffix == '.webp':
+            return 'webp'
+        return 'png'
+
+    def optimize(self, image_path):
+        """Повертає (шлях, MIME тип) оптимізованої копії зображення.
+
+        Якщо зображення не вдалося покращити, повертає вихідний файл.
+        """
+        image_path = Path(image_path)
+        suffix = image_path.suffix.lower()
+        original = (image_path, MIME_TYPES.get(suffix, 'image/png'))
+        if suffix in self.PASSTHROUGH_SUFFIXES:
+            return original
+
+        source_data = image_path.read_bytes()
+        digest = hashlib.sha256(source_data)
+        digest.update(self.settings_key().encode('utf-8'))
+        cache_stem = digest.hexdigest()
+
+        # Шукаємо готовий результат у кеші (лише відомі імена: без сканування папки
+        # і без недописаних .tmp файлів інших процесів)
+        for cache_suffix in self.CACHE_SUFFIXES:
+            cached_path = self.cache_dir / f"{cache_stem}{cache_suffix}"
+            if cached_path.exists():
+                if cache_suffix == '.orig':
+                    return original
+                return cached_path, MIME_TYPES[cache_suffix]
+
+        with Image.open(io.BytesIO(source_data)) as image:
+            image.load()
+            target_format = self.choose_format(suffix)
+            # Фото з телефона зберігають поворот у EXIF, а перестиснута копія його втрачає:
+            # повертаємо самі пікселі до вимірювання ширини
+            rotated = image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+            if rotated:
+                image = ImageOps.exif_transpose(image)
+            resized = image.width > self.max_width
+            if resized:
+                height = max(1, round(image.height * self.max_width / image.width))
+                image = image.resize((self.max_width, height), Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            if target_format == 'jpeg':
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    # JPEG не підтримує прозорість: накладаємо на білий фон
+                    image = image.convert('RGBA')
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                elif image.mode != 'RGB':
+                    image = image.convert('RGB')
+                image.save(buffer, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+                extension = '.jpg'
+            elif target_format == 'webp':
+                image.save(buffer, 'WEBP', quality=self.quality, method=4)
+                extension = '.webp'
+            else:
+                image.save(buffer, 'PNG', optimize=True)
+                extension = '.png'
+
+        optimized_data = buffer.getvalue()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        if not resized and not rotated and len(optimized_data) >= len(source_data):
+            # Перестискання нічого не дало: запам'ятовуємо це, щоб не пробувати знову
+            cache_path = self.cache_dir / f"{cache_stem}.orig"
+            self._write_atomic(cache_path, b'')
+            return original
+
+        cache_path = self.cache_dir / f"{cache_stem}{extension}"
+        self._write_atomic(cache_path, optimized_data)
+        return cache_path, MIME_TYPES[extension]
+
+    def _write_atomic(self, path, data):
+        """Записує файл кешу так, щоб паралельні процеси не бачили недописаних файлів"""
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+
+
+class ChallengeDiscovery:
+    """Пошук папок з задачами через os.scandir з кешем дерева папок.
+
+    Задача - папка з README.md. Якщо repo_path - це сама категорія
+    (див. KNOWN_CATEGORIES), задачі шукаються починаючи з глибини 1, інакше
+    з глибини 2, а категорією вважається перша папка шляху. Всередину
+    знайдених задач пошук не заходить.
+
+    Кеш зберігає для кожної папки її mtime, список підпапок і наявність
+    README.md: якщо mtime не змінився, папка не перечитується.
+    """
+
+    def __init__(self, repo_path, max_depth=None, include=None, exclude=None,
+                 categories=None, cache_path=None):
+        self.repo_path = Path(repo_path)
+        self.category_mode = self.repo_path.name in KNOWN_CATEGORIES
+        self.min_depth = 1 if self.category_mode else 2
+        self.max_depth = max(max_depth or self.min_depth, self.min_depth)
+        self.include = include or []
+        self.exclude = exclude or []
+        self.categories = set(categories) if categories else None
+        self.cache_path = Path(cache_path) if cache_path else None
+
+    def discover(self):
+        """Повертає список задач у стабільному (алфавітному) порядку"""
+        cache = self._load_cache()
+        new_cache = {}
+        challenges = []
+        self._walk(self.repo_path, (), cache, new_cache, challenges)
+        self._save_cache(new_cache)
+        return challenges
+
+    def _walk(self, dir_path, parts, cache, new_cache, challenges):
+        relative = '/'.join(parts)
+        listing = self._list_dir(dir_path, relative, cache)
+        if listing is None:
+            return
+        new_cache[relative] = listing
+
+        depth = len(parts)
+        if depth >= self.min_depth and listing['has_readme']:
+            if self._is_selected(parts):
+                if self.category_mode:
+                    category, name_parts = self.repo_path.name, parts
+                else:
+                    category, name_parts = parts[0], parts[1:]
+                challenges.append({
+                    'category': category,
+                    'name': '/'.join(name_parts),
+                    'path': dir_path,
+                    'readme': dir_path / "README.md"
+                })
+            return  # Всередині задачі лише її файли (assets тощо)
+
+        if depth >= self.max_depth:
+            return
+
+        for name in listing['subdirs']:
+            child_parts = parts + (name,)
+            if not self._is_allowed(child_parts):
+                continue
+            self._walk(dir_path / name, child_parts, cache, new_cache, challenges)
+
+    def _list_dir(self, dir_path, relative, cache):
+        """Повертає {'mtime_ns', 'subdirs', 'has_readme'} для папки, з кешу якщо можливо"""
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return None
+
+        cached = cache.get(relative)
+        if cached and cached.get('mtime_ns') == mtime_ns:
+            return cached
+
+        subdirs = []
+        has_readme = False
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.name == "README.md":
+                        has_readme = has_readme or entry.is_file()
+                    elif not entry.name.startswith('.') and entry.is_dir():
+                        subdirs.append(entry.name)
+        except OSError:
+            return None
+
+        return {'mtime_ns': mtime_ns, 'subdirs': sorted(subdirs), 'has_readme': has_readme}
+
+    def _is_allowed(self, parts):
+        """Чи варто заходити в папку (фільтр категорій та --exclude)"""
+        if self.categories is not None and not self.category_mode and parts[0] not in self.categories:
+            return False
+        relative = '/'.join(parts)
+        return not any(fnmatch.fnmatch(relative, pattern) for pattern in self.exclude)
+
+    def _is_selected(self, parts):
+        """Чи підходить задача під --include"""
+        if self.categories is not None and self.category_mode and self.repo_path.name not in self.categories:
+            return False
+        if not self.include:
+            return True
+        relative = '/'.join(parts)
+        return any(fnmatch.fnmatch(relative, pattern) for pattern in self.include)
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('root') != str(self.repo_path.resolve()):
+            return {}
+        return data.get('dirs', {})
+
+    def _save_cache(self, dirs):
+        if not self.cache_path:
+            return
+        temp_path = self.cache_path.with_suffix('.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'root': str(self.repo_path.resolve()), 'dirs': dirs}, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️  Не вдалося зберегти кеш пошуку задач: {e}")
+
+
+class AssetIndex:
+    """Індекс зображень однієї задачі для пошуку посилань з README.md.
+
+    Папка задачі сканується один раз (рекурсивно, через os.scandir),
+    далі кожне посилання шукається за словником без звернень до диска.
+    Імена порівнюються без урахування регістру.
+    """
+
+    SKIP_DIRS = {'node_modules', '__pycache__'}
+
+    def __init__(self, challenge_dir, max_depth=6):
+        self.challenge_dir = Path(challenge_dir)
+        self.by_path = {}  # відносний шлях у нижньому регістрі -> Path
+        self.by_name = {}  # назва файлу в нижньому регістрі -> [Path, ...]
+        self._scan(str(self.challenge_dir), '', max_depth)
+        # Для однакових назв перевага файлам з assets/, потім найменш вкладеним
+        for paths in self.by_name.values():
+            paths.sort(key=lambda path: (path.parent.name.lower() != 'assets', len(path.parts), str(path)))
+
+    def _scan(self, directory, prefix, depth):
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    relative = f"{prefix}{entry.name}"
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth > 1 and entry.name not in self.SKIP_DIRS:
+                            self._scan(entry.path, f"{relative}/", depth - 1)
+                    elif os.path.splitext(entry.name)[1].lower() in MIME_TYPES:
+                        path = Path(entry.path)
+                        self.by_path[relative.lower()] = path
+                        self.by_name.setdefault(entry.name.lower(), []).append(path)
+        except OSError:
+            pass
+
+    def find(self, img_path):
+        """Повертає Path файлу для посилання з markdown або None"""
+        reference = IMAGE_TITLE_PATTERN.sub('', img_path.strip())
+        if reference.startswith('<') and reference.endswith('>'):
+            reference = reference[1:-1]
+        if reference.startswith(('http://', 'https://', 'data:', 'file:')):
+            return None
+        reference = urllib.parse.unquote(reference.split('#', 1)[0].split('?', 1)[0]).replace('\\', '/')
+
+        # Посилання за межі папки задачі (../shared/logo.png) перевіряємо на диску
+        normalized = os.path.normpath(reference).replace('\\', '/')
+        if os.path.isabs(normalized) or normalized.startswith('../'):
+            candidate = Path(normalized) if os.path.isabs(normalized) else self.challenge_dir / normalized
+            return candidate if candidate.is_file() else None
+
+        key = normalized.lower()
+        found = self.by_path.get(key) or self.by_path.get(f"assets/{key}")
+        if found:
+            return found
+
+        # Файл лежить в іншій підпапці, ніж у посиланні: шукаємо за назвою
+        candidates = self.by_name.get(key.rsplit('/', 1)[-1])
+        return candidates[0] if candidates else None
+
+
+class SiteAssetStore:
+    """Папка assets/ статичного сайту: кожне зображення зберігається один раз.
+
+    Ім'я файлу - хеш вмісту, тож однакові скріншоти з різних задач стають
+    одним файлом. Файли жорстко посилаються (hard link), а якщо це
+    неможливо (інший диск) - копіюються.
+    """
+
+    def __init__(self, assets_dir):
+        self.assets_dir = Path(assets_dir)
+        self.digests = {}  # (шлях, розмір, mtime) -> ім'я файлу на сайті
+        self.published = set()
+
+    def publish(self, image_path):
+        """Повертає відносне посилання на зображення в assets/ сайту"""
+        stat = image_path.stat()
+        key = (str(image_path), stat.st_size, stat.st_mtime_ns)
+        name = self.digests.get(key)
+        if name is None:
+            digest = hashlib.sha256()
+            with open(image_path, 'rb') as image_file:
+                for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            name = self.digests[key] = f"{digest.hexdigest()[:24]}{image_path.suffix.lower()}"
+
+        target = self.assets_dir / name
+        if name not in self.published and not target.exists():
+            self.assets_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(image_path, target)
+            except OSError:
+                shutil.copyfile(image_path, target)
+        self.published.add(name)
+        return f"assets/{name}"
+
+    def remove_unused(self):
+        """Видаляє зображення, на які більше не посилається жодна сторінка"""
+        if not self.assets_dir.exists():
+            return
+        for path in self.assets_dir.iterdir():
+            if path.name not in self.published:
+                path.unlink()
+
+
+@contextlib.contextmanager
+def stage_timer(timings, stage):
+    """Додає тривалість блоку (в секундах) до timings[stage]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - started
+
+
+class HighlightCache:
+    """Кеш підсвічених блоків коду: LRU у пам'яті та файли на диску.
+
+    Ключ - хеш коду, мови та налаштувань Pygments, тож однакові лістинги
+    (і незмінені writeup'и між запусками) лексуються лише раз.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=512):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Повертає HTML з кешу або None"""
+        html_content = self.entries.get(key)
+        if html_content is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return html_content
+
+        if self.cache_dir:
+            try:
+                html_content = (self.cache_dir / f"{key}.html").read_text(encoding='utf-8')
+            except OSError:
+                html_content = None
+            if html_content is not None:
+                self.hits += 1
+                self._remember(key, html_content)
+                return html_content
+
+        self.misses += 1
+        return None
+
+    def put(self, key, html_content):
+        self._remember(key, html_content)
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self.cache_dir / f"{key}.html"
+            temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            temp_path.write_text(html_content, encoding='utf-8')
+            os.replace(temp_path, path)
+
+    def _remember(self, key, html_content):
+        self.entries[key] = html_content
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class CachedFencedCodePreprocessor(Preprocessor):
+    """Обробляє ```блоки коду``` до fenced_code, беручи підсвічування з HighlightCache.
+
+    Результат такий самий, як у fenced_code + codehilite. Блоки з {атрибутами}
+    залишаються стандартному fenced_code.
+    """
+
+    def __init__(self, md, highlight_cache, limit_bytes):
+        super().__init__(md)
+        self.highlight_cache = highlight_cache
+        self.limit_bytes = limit_bytes
+        self.codehilite_config = None
+
+    def run(self, lines):
+        if self.codehilite_config is None:
+            self.codehilite_config = next(
+                (ext.getConfigs() for ext in self.md.registeredExtensions if isinstance(ext, CodeHiliteExtension)),
+                {}
+            )
+
+        text = "\n".join(lines)
+        index = 0
+        while True:
+            match = FencedBlockPreprocessor.FENCED_BLOCK_RE.search(text, index)
+            if not match:
+                break
+            if match.group('attrs'):
+                index = match.end()
+                continue
+
+            code_html = self.highlight(match.group('code'), match.group('lang'), match.group('hl_lines'))
+            placeholder = self.md.htmlStash.store(code_html)
+            text = f"{text[:match.start()]}\n{placeholder}\n{text[match.end():]}"
+            index = match.start() + 1 + len(placeholder)
+        return text.split("\n")
+
+    def highlight(self, code, lang, hl_lines):
+        """HTML блоку коду: з кешу, підсвічений Pygments або просто екранований"""
+        config = dict(self.codehilite_config)
+        if not config.get('use_pygments', True) or len(code.encode('utf-8')) > self.limit_bytes:
+            # Гігантські лістинги (дизасемблер, дампи) не підсвічуємо
+            lang_class = f' class="language-{html.escape(lang)}"' if lang else ''
+            return f'<div class="codehilite"><pre><code{lang_class}>{html.escape(code, quote=False)}</code></pre></div>'
+
+        if hl_lines:
+            config['hl_lines'] = [int(line) for line in hl_lines.split()]
+        digest = hashlib.sha256()
+        digest.update(f"{pygments.__version__}\0{lang}\0{sorted(config.items())}\0".encode('utf-8'))
+        digest.update(code.encode('utf-8'))
+        key = digest.hexdigest()
+
+        code_html = self.highlight_cache.get(key)
+        if code_html is None:
+            style = config.pop('pygments_style', 'default')
+            code_html = CodeHilite(code, lang=lang, style=style, **config).hilite(shebang=False)
+            self.highlight_cache.put(key, code_html)
+        return code_html
+
+
+class MarkdownRenderer:
+    """Перевикористовуваний рендерер Markdown → HTML.
+
+    Створюється один раз на процес: екземпляр markdown.Markdown з розширеннями
+    та HTML шаблон з CSS будуються в конструкторі, а між документами
+    Markdown лише скидається через reset(). Рендер з різних потоків
+    виконується по черзі (блокування).
+    """
+
+    EXTENSIONS = [
+        'codehilite',
+        'fenced_code',
+        'tables',
+        'toc'
+    ]
+
+    def __init__(self, css_styles=CSS_STYLES, title="CTF Writeup", highlight_cache=None,
+                 highlight_limit_kb=DEFAULT_HIGHLIGHT_LIMIT_KB):
+        self.md = markdown.Markdown(extensions=self.EXTENSIONS)
+        self.lock = threading.Lock()
+        self.highlight_limit_kb = highlight_limit_kb
+        # Підсвічування блоків коду з кешем; виконується до fenced_code (пріоритет 25)
+        self.highlight_cache = highlight_cache or HighlightCache()
+        self.md.preprocessors.register(
+            CachedFencedCodePreprocessor(self.md, self.highlight_cache, highlight_limit_kb * 1024),
+            'cached_fenced_code', 26
+        )
+        self.html_prefix = f"""
         <!DOCTYPE html>
         <html>
         <head>
             <meta charset="utf-8">
-            <title>CTF Writeup</title>
+            <title>{title}</title>
             {css_styles}
         </head>
         <body>
-            {html_content}
+            """
+        self.html_suffix = """
         </body>
         </html>
         """
 
-    async def convert_to_pdf(self, challenge, browser):
-        """Конвертує один writeup в PDF"""
+    def render_body(self, markdown_content):
+        """Конвертує markdown у фрагмент HTML (без шаблону)"""
+        with self.lock:
+            try:
+                return self.md.convert(markdown_content)
+            finally:
+                self.md.reset()
+
+    def render(self, markdown_content):
+        """Конвертує markdown у повний HTML документ зі стилями"""
+        return self.html_prefix + self.render_body(markdown_content) + self.html_suffix
+
+    def render_many(self, documents):
+        """Конвертує багато документів підряд одним екземпляром Markdown"""
+        return [self.render(markdown_content) for markdown_content in documents]
+
+
+class HtmlFlowableBuilder(HTMLParser):
+    """Перетворює HTML від MarkdownRenderer на flowables reportlab.
+
+    Підтримує заголовки, абзаци, списки, цитати, блоки коду, таблиці,
+    зображення та лінії. Решта тегів пропускається, текст з них зберігається.
+    """
+
+    BLOCK_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'}
+    INLINE_TAGS = {'strong': 'b', 'b': 'b', 'em': 'i', 'i': 'i', 'del': 'strike', 's': 'strike'}
+    SKIP_TAGS = {'head', 'style', 'script', 'title'}
+
+    def __init__(self, backend):
+        super().__init__(convert_charrefs=True)
+        self.backend = backend
+        self.styles = backend.styles
+        self.flowables = []
+        self.inline = []  # Розмітка reportlab поточного абзацу
+        self.block_style = 'body'
+        self.bullet = None
+        # Відкриті inline теги поточного абзацу: (відкриваючий, закриваючий) для reportlab.
+        # Зображення розриває абзац, тож теги закриваються перед ним і відкриваються знову
+        self.open_inline = []
+        self.lists = []  # Стек [тип списку, лічильник]
+        self.quote_depth = 0
+        self.skip_depth = 0
+        self.pre = None  # Текст блоку коду, поки ми всередині <pre>
+        self.table = None  # Рядки таблиці: список списків (розмітка, заголовок?)
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif self.skip_depth or self.pre is not None:
+            return
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            if tag == 'li':
+                self.block_style = 'bullet'
+                if self.lists:
+                    self.lists[-1][1] += 1
+                    list_type, counter = self.lists[-1]
+                    self.bullet = f"{counter}." if list_type == 'ol' else '•'
+            elif tag == 'p' and self.lists:
+                self.block_style = 'bullet'
+            elif tag == 'p':
+                self.block_style = 'quote' if self.quote_depth else 'body'
+            else:
+                self.block_style = tag
+        elif tag in ('ul', 'ol'):
+            self.flush()
+            self.lists.append([tag, 0])
+        elif tag == 'blockquote':
+            self.flush()
+            self.quote_depth += 1
+        elif tag == 'pre':
+            self.flush()
+            self.pre = []
+        elif tag == 'code':
+            self.open_tag(f'<font face="{self.backend.fonts["mono"]}" color="#c7254e">', '</font>')
+        elif tag in self.INLINE_TAGS:
+            self.open_tag(f'<{self.INLINE_TAGS[tag]}>', f'</{self.INLINE_TAGS[tag]}>')
+        elif tag == 'a':
+            href = attrs.get('href') or ''
+            # Внутрішні якорі (#...) reportlab не знає, тож для них лише текст
+            if href.startswith(('http://', 'https://', 'mailto:')):
+                self.open_tag(f'<a href="{html.escape(href)}" color="#0366d6">', '</a>')
+            else:
+                self.open_tag('', '')
+        elif tag == 'br':
+            self.inline.append('<br/>')
+        elif tag == 'hr':
+            self.flush()
+            self.flowables.append(platypus.HRFlowable(width='100%', color=colors.HexColor('#dddddd'),
+                                                      spaceBefore=6, spaceAfter=6))
+        elif tag == 'img':
+            self.flush()
+            self.flowables.append(self.backend.image_flowable(attrs.get('src', ''), attrs.get('alt', '')))
+        elif tag == 'table':
+            self.flush()
+            self.table = []
+        elif tag == 'tr' and self.table is not None:
+            self.table.append([])
+        elif tag in ('td', 'th') and self.table is not None:
+            self.inline = []
+            self.cell = tag
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif self.skip_depth:
+            return
+        elif tag == 'pre':
+            text = ''.join(self.pre or []).rstrip('\n')
+            self.pre = None
+            self.flowables.append(self.backend.code_flowable(text))
+        elif self.pre is not None:
+            return
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            self.block_style = 'quote' if self.quote_depth else 'body'
+        elif tag in ('ul', 'ol'):
+            self.flush()
+            if self.lists:
+                self.lists.pop()
+        elif tag == 'blockquote':
+            self.flush()
+            self.quote_depth = max(0, self.quote_depth - 1)
+        elif (tag == 'code' or tag == 'a' or tag in self.INLINE_TAGS) and self.open_inline:
+            self.inline.append(self.open_inline.pop()[1])
+        elif tag in ('td', 'th') and self.table is not None and self.cell:
+            if self.table:
+                self.table[-1].append((''.join(self.inline).strip(), self.cell == 'th'))
+            self.inline = []
+            self.cell = None
+        elif tag == 'table' and self.table is not None:
+            self.flowables.append(self.backend.table_flowable(self.table))
+            self.table = None
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.pre is not None:
+            self.pre.append(data)
+        else:
+            self.inline.append(html.escape(data, quote=False))
+
+    def open_tag(self, opening, closing):
+        self.inline.append(opening)
+        self.open_inline.append((opening, closing))
+
+    def flush(self):
+        """Завершує поточний абзац; відкриті inline теги закриваються і переходять у наступний"""
+        closing = ''.join(closing for _, closing in reversed(self.open_inline))
+        markup = (''.join(self.inline) + closing).strip()
+        self.inline = [opening for opening, _ in self.open_inline]
+        bullet, self.bullet = self.bullet, None
+        # Абзац лише з тегів (посилання навколо зображення) не виводимо
+        if not HTML_TAG_PATTERN.sub('', markup).strip() or self.table is not None:
+            return
+        self.flowables.append(platypus.Paragraph(markup, self.styles[self.block_style], bulletText=bullet))
+
+    def build(self, html_content):
+        self.feed(html_content)
+        self.close()
+        self.flush()
+        return self.flowables
+
+
+class ReportlabBackend:
+    """Легкий бекенд HTML → PDF на reportlab без Chromium.
+
+    Верстка простіша (без CSS та підсвітки синтаксису), зате запуск
+    миттєвий і пам'яті потрібно в рази менше - для чернеток і масових
+    переглядів. Для кирилиці реєструється DejaVuSans, якщо він знайдений.
+    """
+
+    FONT_DIRS = [
+        '/usr/share/fonts/truetype/dejavu',
+        '/usr/share/fonts/dejavu',
+        '/usr/share/fonts/TTF',
+        '/Library/Fonts',
+        os.path.expanduser('~/Library/Fonts'),
+        'C:/Windows/Fonts',
+    ]
+
+    FONT_FILES = {
+        'regular': ['DejaVuSans.ttf', 'Arial.ttf', 'arial.ttf'],
+        'bold': ['DejaVuSans-Bold.ttf', 'Arial Bold.ttf', 'arialbd.ttf'],
+        'mono': ['DejaVuSansMono.ttf', 'Courier New.ttf', 'cour.ttf'],
+    }
+
+    # Вбудовані шрифти reportlab (без кирилиці), якщо TTF не знайдено
+    FALLBACK_FONTS = {'regular': 'Helvetica', 'bold': 'Helvetica-Bold', 'mono': 'Courier'}
+
+    CODE_LINE_LENGTH = 95  # Символів моноширинного шрифту 8pt на ширину сторінки
+
+    def __init__(self):
+        self.fonts = self.register_fonts()
+        self.styles = self.build_styles()
+        self.frame_width = A4[0] - 4 * cm
+        self.frame_height = A4[1] - 4 * cm
+
+    def register_fonts(self):
+        """Реєструє TTF шрифти з кирилицею (один раз на процес)"""
+        fonts = {}
+        registered = pdfmetrics.getRegisteredFontNames()
+        for role, file_names in self.FONT_FILES.items():
+            font_name = f"GetCtf-{role}"
+            if font_name in registered:
+                fonts[role] = font_name
+                continue
+            for font_dir in self.FONT_DIRS:
+                font_path = next((Path(font_dir) / name for name in file_names
+                                  if (Path(font_dir) / name).exists()), None)
+                if font_path:
+                    try:
+                        pdfmetrics.registerFont(TTFont(font_name, str(font_path)))
+                        fonts[role] = font_name
+                    except Exception:
+                        continue
+                    break
+            fonts.setdefault(role, self.FALLBACK_FONTS[role])
+
+        if fonts['regular'] != self.FALLBACK_FONTS['regular']:
+            pdfmetrics.registerFontFamily(
+                fonts['regular'], normal=fonts['regular'], bold=fonts['bold'],
+                italic=fonts['regular'], boldItalic=fonts['bold']
+            )
+        return fonts
+
+    def build_styles(self):
+        """Стилі абзаців, близькі до CSS_STYLES"""
+        regular, bold, mono = self.fonts['regular'], self.fonts['bold'], self.fonts['mono']
+        body = ParagraphStyle('body', fontName=regular, fontSize=10, leading=14, spaceAfter=6,
+                              textColor=colors.HexColor('#333333'))
+        styles = {
+            'body': body,
+            'bullet': ParagraphStyle('bullet', parent=body, leftIndent=18, bulletIndent=6, spaceAfter=3),
+            'quote': ParagraphStyle('quote', parent=body, leftIndent=14, textColor=colors.HexColor('#666666')),
+            'cell': ParagraphStyle('cell', parent=body, fontSize=9, leading=12, spaceAfter=0),
+            'code': ParagraphStyle('code', parent=body, fontName=mono, fontSize=8, leading=10.5,
+                                   backColor=colors.HexColor('#f6f8fa'), borderPadding=6,
+                                   spaceBefore=6, spaceAfter=10),
+        }
+        sizes = {'h1': 20, 'h2': 16, 'h3': 13, 'h4': 11, 'h5': 10, 'h6': 10}
+        for tag, size in sizes.items():
+            styles[tag] = ParagraphStyle(tag, parent=body, fontName=bold, fontSize=size, leading=size * 1.3,
+                                         spaceBefore=size * 0.8, spaceAfter=size * 0.4,
+                                         textColor=colors.HexColor('#2c3e50'))
+        return styles
+
+    def code_flowable(self, text):
+        """Блок коду: моноширинний текст з переносом довгих рядків"""
+        return platypus.Preformatted(text, self.styles['code'], maxLineLength=self.CODE_LINE_LENGTH,
+                                     newLineChars='')
+
+    def table_flowable(self, rows):
+        """Таблиця з рамками; комірки - абзаци, тому довгий текст переноситься"""
+        rows = [row for row in rows if row]
+        if not rows:
+            return platypus.Spacer(1, 0)
+        columns = max(len(row) for row in rows)
+        cell_style = self.styles['cell']
+        data = [
+            [platypus.Paragraph(f"<b>{markup}</b>" if header else markup, cell_style)
+             for markup, header in row] + [''] * (columns - len(row))
+            for row in rows
+        ]
+        table = platypus.Table(data, colWidths=[self.frame_width / columns] * columns, repeatRows=1)
+        table.setStyle(platypus.TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dddddd')),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f2f2f2')),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        return table
+
+    def image_flowable(self, src, alt_text):
+        """Зображення з data: URI або file:// посилання, зменшене під розмір сторінки"""
         try:
-            print(f"Обробляю: {challenge['category']} - {challenge['name']}")
+            if src.startswith('data:'):
+                source = io.BytesIO(base64.b64decode(src.split(',', 1)[1]))
+            elif src.startswith('file://'):
+                source = urllib.request.url2pathname(urllib.parse.urlparse(src).path)
+            else:
+                source = src
+            width, height = ImageReader(source).getSize()
+            if isinstance(source, io.BytesIO):
+                source.seek(0)
+            scale = min(1.0, self.frame_width / width, self.frame_height * 0.9 / height)
+            return platypus.Image(source, width=width * scale, height=height * scale)
+        except Exception:
+            return platypus.Paragraph(html.escape(f"[Зображення: {alt_text or src[:80]}]"), self.styles['quote'])
+
+    def render(self, html_content, output_path=None):
+        """Верстає HTML у PDF. Записує файл, якщо передано output_path; повертає байти PDF"""
+        flowables = HtmlFlowableBuilder(self).build(html_content)
+        buffer = io.BytesIO()
+        document = platypus.SimpleDocTemplate(
+            buffer, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm
+        )
+        document.build(flowables or [platypus.Spacer(1, 0)])
+        pdf_data = buffer.getvalue()
+        if output_path:
+            with open(output_path, 'wb') as f:
+                f.write(pdf_data)
+        return pdf_data
+
+
+class StreamingPdfWriter:
+    """Мінімальний PDF writer, що пише об'єкти у файл одразу.
+
+    Сторінки копіюються разом з усіма об'єктами, на які вони посилаються,
+    з новою нумерацією. У пам'яті залишаються лише зміщення об'єктів
+    для таблиці xref та номери сторінок для дерева /Pages.
+    """
+
+    CATALOG_NUMBER = 1
+    PAGES_NUMBER = 2
+
+    # Ключі FontDescriptor, що вказують на вбудовані файли шрифтів
+    FONT_FILE_KEYS = ('/FontFile', '/FontFile2', '/FontFile3')
+
+    def __init__(self, stream, dedup=False, compress=False, next_number=3, previous_xref=None):
+        self.stream = stream
+        self.offsets = {}  # номер об'єкта -> зміщення у файлі
+        self.next_number = next_number
+        self.page_numbers = []
+        # Інкрементне оновлення: stream стоїть в кінці існуючого файлу, previous_xref -
+        # зміщення його таблиці xref; дописуються лише нові об'єкти та дерево сторінок
+        self.previous_xref = previous_xref
+        self.xref_offset = None
+        # dedup: однакові зображення та файли шрифтів зберігаються один раз
+        # на весь файл; shared - хеш вмісту -> номер вже записаного об'єкта
+        self.dedup = dedup
+        self.shared = {}
+        self.dedup_hits = 0
+        # compress: нестиснуті потоки (наприклад, вміст сторінок) стискаються FlateDecode
+        self.compress = compress
+        self.catalog_entries = {}  # Додаткові записи каталогу (закладки, теги, іменовані цілі)
+        if previous_xref is None:
+            self.stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self):
+        return len(self.page_numbers)
+
+    def add_document(self, reader):
+        """Копіює всі сторінки документа (спільні ресурси пишуться один раз)"""
+        copied = {}
+        for page in reader.pages:
+            self.add_page(page, copied)
+
+    def add_page(self, page, copied):
+        """Копіює одну сторінку. copied - словник вже скопійованих об'єктів
+        цього документа: (idnum, generation) -> новий номер"""
+        pending = []
+        page_number = self._number_for(page.indirect_reference, copied, pending)
+        self.page_numbers.append(page_number)
+
+        # Записуємо сторінку та все, на що вона посилається (шрифти, зображення, вміст).
+        # Сторінку могли вже записати раніше, якщо на неї посилалась інша сторінка
+        while pending:
+            reference = pending.pop()
+            number = copied[(reference.idnum, reference.generation)]
+            self._write_object(number, self._remap(reference.get_object(), copied, pending))
+
+    def _write_incremental_xref(self):
+        """Секція xref лише для нових об'єктів з посиланням /Prev на попередню"""
+        self.xref_offset = self.stream.tell()
+        self.stream.write(b"xref\n")
+        numbers = sorted(self.offsets)
+        start = 0
+        while start < len(numbers):
+            # Підсекції з послідовних номерів
+            end = start
+            while end + 1 < len(numbers) and numbers[end + 1] == numbers[end] + 1:
+                end += 1
+            self.stream.write(f"{numbers[start]} {end - start + 1}\n".encode('ascii'))
+            for number in numbers[start:end + 1]:
+                self.stream.write(f"{self.offsets[number]:010d} 00000 n \n".encode('ascii'))
+            start = end + 1
+
+        self.stream.write(
+            f"trailer\n<< /Size {self.next_number} /Root {self.CATALOG_NUMBER} 0 R /Prev {self.previous_xref} >>\n"
+            f"startxref\n{self.xref_offset}\n%%EOF\n".encode('ascii')
+        )
+
+    def copy_catalog_entries(self, catalog, copied, skip_keys=('/Type', '/Pages')):
+        """Переносить записи каталогу (/Outlines, /Names, /StructTreeRoot...) з документа,
+        сторінки якого вже скопійовано з тим самим словником copied"""
+        pending = []
+        for key, value in catalog.items():
+            if key not in skip_keys:
+                self.catalog_entries[key] = self._remap(value, copied, pending)
+        while pending:
+            reference = pending.pop()
+            number = copied[(reference.idnum, reference.generation)]
+            self._write_object(number, self._remap(reference.get_object(), copied, pending))
+
+    def close(self):
+        """Записує дерево сторінок, каталог, xref та trailer"""
+        pages = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(
+                IndirectObject(number, 0, None) for number in self.page_numbers
+            ),
+            NameObject('/Count'): NumberObject(len(self.page_numbers)),
+        })
+        self._write_object(self.PAGES_NUMBER, pages)
+
+        if self.previous_xref is not None:
+            self._write_incremental_xref()
+            return
 
-            # Читаємо markdown файл
-            with open(challenge['readme'], 'r', encoding='utf-8') as f:
-                markdown_content = f.read()
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES_NUMBER, 0, None),
+        })
+        for key, value in self.catalog_entries.items():
+            catalog[NameObject(key)] = value
+        self._write_object(self.CATALOG_NUMBER, catalog)
+
+        xref_offset = self.xref_offset = self.stream.tell()
+        size = self.next_number
+        self.stream.write(f"xref\n0 {size}\n".encode('ascii'))
+        self.stream.write(b"0000000000 65535 f \n")
+        for number in range(1, size):
+            offset = self.offsets.get(number)
+            if offset is None:
+                self.stream.write(b"0000000000 65535 f \n")
+            else:
+                self.stream.write(f"{offset:010d} 00000 n \n".encode('ascii'))
 
-            # Додаємо заголовок з інформацією про задачу
-            header = f"""# {challenge['name']}
+        self.stream.write(
+            f"trailer\n<< /Size {size} /Root {self.CATALOG_NUMBER} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode('ascii')
+        )
 
-**Категорія:** {challenge['category']}
+    def _number_for(self, reference, copied, pending, shareable=False):
+        """Повертає новий номер для посилання, ставлячи об'єкт у чергу на запис.
 
----
+        shareable - об'єкт можна замінити вже записаною ідентичною копією
+        (файли шрифтів; зображення визначаються автоматично).
+        """
+        key = (reference.idnum, reference.generation)
+        number = copied.get(key)
+        if number is not None:
+            return number
+
+        digest = None
+        if self.dedup:
+            obj = reference.get_object()
+            if shareable or (isinstance(obj, StreamObject) and obj.get('/Subtype') == '/Image'):
+                digest = self._content_hash(obj)
+                number = self.shared.get(digest)
+                if number is not None:
+                    self.dedup_hits += 1
+                    copied[key] = number
+                    return number
+
+        number = self.next_number
+        self.next_number += 1
+        copied[key] = number
+        if digest is not None:
+            self.shared[digest] = number
+        pending.append(reference)
+        return number
+
+    def _content_hash(self, obj, depth=0):
+        """Хеш вмісту об'єкта разом з усім, на що він посилається (SMask, ICC профілі)"""
+        digest = hashlib.sha256()
+        if depth > 8:
+            digest.update(b'deep')
+        elif isinstance(obj, IndirectObject):
+            return self._content_hash(obj.get_object(), depth + 1)
+        elif isinstance(obj, StreamObject):
+            digest.update(b'stream')
+            digest.update(hashlib.sha256(obj._data).digest())
+            for key in sorted(obj.keys()):
+                if key != '/Length':
+                    digest.update(key.encode('utf-8') + self._content_hash(obj.raw_get(key), depth + 1))
+        elif isinstance(obj, DictionaryObject):
+            digest.update(b'dict')
+            for key in sorted(obj.keys()):
+                digest.update(key.encode('utf-8') + self._content_hash(obj.raw_get(key), depth + 1))
+        elif isinstance(obj, ArrayObject):
+            digest.update(b'array')
+            for value in obj:
+                digest.update(self._content_hash(value, depth + 1))
+        else:
+            digest.update(repr(obj).encode('utf-8'))
+        return digest.digest()
+
+    def _remap(self, obj, copied, pending):
+        """Копіює об'єкт, замінюючи посилання на нові номери"""
+        if isinstance(obj, IndirectObject):
+            return IndirectObject(self._number_for(obj, copied, pending), 0, None)
+
+        if isinstance(obj, StreamObject):
+            stream_copy = type(obj)()
+            stream_copy._data = obj._data
+            for key, value in obj.items():
+                # /Length перераховується при записі (і може бути непрямим посиланням)
+                if key != '/Length':
+                    stream_copy[NameObject(key)] = self._remap(value, copied, pending)
+            if self.compress and '/Filter' not in stream_copy and len(stream_copy._data) > 64:
+                stream_copy._data = zlib.compress(stream_copy._data)
+                stream_copy[NameObject('/Filter')] = NameObject('/FlateDecode')
+            return stream_copy
+
+        if isinstance(obj, DictionaryObject):
+            dict_copy = DictionaryObject()
+            is_page = obj.get('/Type') == '/Page'
+            for key, value in obj.items():
+                if is_page and key == '/Parent':
+                    # Сторінки підключаються до нового дерева /Pages
+                    dict_copy[NameObject(key)] = IndirectObject(self.PAGES_NUMBER, 0, None)
+                elif key in self.FONT_FILE_KEYS and isinstance(value, IndirectObject):
+                    number = self._number_for(value, copied, pending, shareable=True)
+                    dict_copy[NameObject(key)] = IndirectObject(number, 0, None)
+                else:
+                    dict_copy[NameObject(key)] = self._remap(value, copied, pending)
+            return dict_copy
+
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._remap(value, copied, pending) for value in obj)
+
+        return obj
+
+    def _write_object(self, number, obj):
+        self.offsets[number] = self.stream.tell()
+        self.stream.write(f"{number} 0 obj\n".encode('ascii'))
+        obj.write_to_stream(self.stream, None)
+        self.stream.write(b"\nendobj\n")
+
+
+def optimize_pdf(source_path, output_path):
+    """Переписує PDF з об'єднанням однакових зображень і файлів шрифтів
+    та стисненням нестиснутих потоків. Повертає кількість прибраних дублікатів."""
+    with open(source_path, 'rb') as source_file, open(output_path, 'wb') as output_file:
+        reader = PdfReader(source_file)
+        writer = StreamingPdfWriter(output_file, dedup=True, compress=True)
+        copied = {}  # Один словник на весь документ: спільні об'єкти пишуться раз
+        for page in reader.pages:
+            writer.add_page(page, copied)
+        writer.copy_catalog_entries(reader.trailer['/Root'], copied)
+        writer.close()
+    return writer.dedup_hits
+
+
+def count_pdf_pages(pdf_data):
+    """Кількість сторінок у PDF (None, якщо PyPDF2 не встановлений або PDF не читається)"""
+    if not MERGE_AVAILABLE:
+        return None
+    try:
+        return len(PdfReader(io.BytesIO(pdf_data)).pages)
+    except Exception:
+        return None
+
+
+def peak_rss_mb():
+    """Пікове використання пам'яті процесом у MB (None, якщо недоступно)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux повертає кілобайти, macOS - байти
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
 
-"""
-            markdown_content = header + markdown_content
 
-            # Обробляємо зображення
-            assets_dir = challenge['path'] / 'assets'
-            processed_markdown = self.process_images_in_markdown(markdown_content, assets_dir)
+class CTFWriteupConverter:
+    def __init__(self, repo_path, output_dir="pdf_writeups", jobs=1, shards=1, use_cache=True,
+                 image_dpi=150, image_format='auto', image_quality=85, asset_mode='inline',
+                 merge_mode='memory', engine='pdfs', max_depth=None, include=None, exclude=None,
+                 categories=None, discovery_cache=True, stats_path=None, renderer=None,
+                 optimize_pdf=False, backend='chromium', highlight_limit_kb=DEFAULT_HIGHLIGHT_LIMIT_KB,
+                 page_timeout=120, retries=2, git_changes=False, prepare_workers=1,
+                 split_by=None, volume_limit=None):
+        self.repo_path = Path(repo_path)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+        self.jobs = max(1, jobs)  # Скільки сторінок рендеримо одночасно
+        self.shards = max(1, shards)  # Скільки процесів з власним Chromium
+        self.use_cache = use_cache  # Чи пропускати задачі, які не змінилися
+        # 'inline' - base64 прямо в HTML, 'file' - Chromium читає файли з диска сам
+        self.asset_mode = asset_mode
+        # 'memory' - PdfWriter збирає все в пам'яті, 'stream' - запис у файл по ходу
+        self.merge_mode = merge_mode
+        # 'pdfs' - окремий PDF на задачу + об'єднання, 'book' - один друк усієї колекції
+        self.engine = engine
+        # 'chromium' - друк через Playwright, 'reportlab' - швидкі чернетки без браузера
+        self.backend = backend
+        self.pdf_backend = ReportlabBackend() if backend == 'reportlab' else None
+        if self.pdf_backend:
+            self.asset_mode = 'file'  # reportlab читає зображення з диска, base64 лише зайва робота
+        self.optimize_pdf = optimize_pdf  # Прибирати дублікати ресурсів в об'єднаному PDF
+        # None - один ALL_WRITEUPS_MERGED.pdf; 'category', 'pages' або 'size' - томи в volumes/
+        self.split_by = split_by
+        self.volume_limit = volume_limit  # Сторінок ('pages') або МБ ('size') на том
+        self.image_optimizer = None  # image_dpi=0 вимикає оптимізацію зображень
+        if image_dpi:
+            self.image_optimizer = ImageOptimizer(
+                self.output_dir / ".image_cache",
+                dpi=image_dpi, image_format=image_format, quality=image_quality
+            )
+        self.highlight_limit_kb = highlight_limit_kb
+        # Один рендерер на процес; підсвічені блоки коду кешуються поруч з PDF
+        self.renderer = renderer or MarkdownRenderer(
+            highlight_cache=HighlightCache(self.output_dir / ".highlight_cache"),
+            highlight_limit_kb=highlight_limit_kb
+        )
+        self.on_result = None  # async callback(challenge, output_path) після кожної задачі
+        # Виконувати синхронні етапи run() в потоці (сервер: цикл подій спільний для всіх задач).
+        # У CLI вони лишаються в основному потоці, щоб їх бачив --profile
+        self.blocking_in_thread = False
+        self.discovery = ChallengeDiscovery(
+            self.repo_path, max_depth=max_depth, include=include, exclude=exclude,
+            categories=categories,
+            cache_path=self.output_dir / DISCOVERY_CACHE_NAME if discovery_cache else None
+        )
+        self.page_timeout = page_timeout  # Секунд на завантаження і друк однієї сторінки (0 - без обмеження)
+        self.retries = max(0, retries)  # Повторні спроби після помилки, тайм-ауту чи падіння браузера
+        self.git_changes = git_changes  # Вибирати змінені задачі за git diff замість хешування файлів
+        # Підготовка HTML паралельно з друком: 0 - в циклі подій, 1 - фоновий потік, N - N процесів
+        self.prepare_workers = max(0, prepare_workers)
+        self.journal = None  # Відкритий журнал готових задач (лише під час run)
+        self._playwright = None  # Playwright і браузер, запущені browser_session (для перезапуску)
+        self._browser = None
+        self._restart_lock = asyncio.Lock()
+        self.asset_indexes = {}  # Папка задачі -> AssetIndex
+        self.generated_pdfs = []  # Список згенерованих PDF файлів
+        self.pdf_challenges = {}  # Назва PDF -> задача (категорії та назви для томів)
+        self.stats = []  # Час етапів та розміри для кожної задачі
+        self.stats_path = stats_path  # Куди записати статистику у JSON
+        self.merge_timings = {}  # Час додавання кожного PDF при об'єднанні
+
+    def find_challenge_folders(self):
+        """Знаходить всі папки з задачами (які містять README.md)"""
+        return self.discovery.discover()
+
+    def output_path_for(self, challenge):
+        """Повертає шлях до PDF файлу задачі"""
+        safe_name = challenge['name'].replace(' ', '_').replace('/', '_')
+        output_filename = f"{challenge['category']}_{safe_name}.pdf"
+        return self.output_dir / output_filename
+
+    def compute_build_key(self, challenge):
+        """Обчислює ключ кешу задачі: хеш README.md, усіх зображень, на які він
+        посилається, CSS шаблону та версії конвертера"""
+        digest = hashlib.sha256()
+        digest.update(CONVERTER_VERSION.encode('utf-8'))
+        digest.update(CSS_STYLES.encode('utf-8'))
+        digest.update(self.backend.encode('utf-8'))
+        digest.update(f"highlight={self.highlight_limit_kb}\0".encode('utf-8'))
+        digest.update(f"{challenge['category']}\0{challenge['name']}\0".encode('utf-8'))
+        if self.image_optimizer:
+            digest.update(self.image_optimizer.settings_key().encode('utf-8'))
+
+        readme_data = Path(challenge['readme']).read_bytes()
+        digest.update(readme_data)
+
+        assets_dir = challenge['path'] / 'assets'
+        markdown_content = readme_data.decode('utf-8', errors='replace')
+        for match in IMAGE_PATTERN.finditer(markdown_content):
+            img_path = self.find_image(match.group(2), assets_dir)
+            digest.update(match.group(2).encode('utf-8') + b'\0')
+            if img_path is None:
+                continue
+            with open(img_path, 'rb') as img_file:
+                for chunk in iter(lambda: img_file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def build_settings_key(self):
+        """Ключ налаштувань, що впливають на всі PDF (для режиму --git-changes)"""
+        digest = hashlib.sha256()
+        digest.update(CONVERTER_VERSION.encode('utf-8'))
+        digest.update(CSS_STYLES.encode('utf-8'))
+        digest.update(self.backend.encode('utf-8'))
+        digest.update(f"highlight={self.highlight_limit_kb}\0".encode('utf-8'))
+        if self.image_optimizer:
+            digest.update(self.image_optimizer.settings_key().encode('utf-8'))
+        return digest.hexdigest()
+
+    def compute_text_key(self, markdown_content):
+        """Ключ кешу для згенерованого markdown (наприклад, індексу)"""
+        digest = hashlib.sha256()
+        digest.update(CONVERTER_VERSION.encode('utf-8'))
+        digest.update(CSS_STYLES.encode('utf-8'))
+        digest.update(self.backend.encode('utf-8'))
+        digest.update(markdown_content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def compute_merged_key(self, manifest):
+        """Ключ кешу об'єднаного PDF: ключі всіх частин та параметри об'єднання"""
+        return self.compute_text_key("\n".join(
+            [f"{pdf_path.name}={manifest.get(pdf_path.name, '')}" for pdf_path in self.generated_pdfs]
+            + [f"optimize_pdf={self.optimize_pdf}", f"split={self.split_by}:{self.volume_limit}"]
+        ))
+
+    def merged_output_path(self):
+        """Результат об'єднання: ALL_WRITEUPS_MERGED.pdf або папка з томами"""
+        if self.split_by:
+            return self.output_dir / VOLUMES_DIR_NAME
+        return self.output_dir / "ALL_WRITEUPS_MERGED.pdf"
+
+    def load_build_manifest(self):
+        """Читає маніфест збірки з папки результатів"""
+        manifest_path = self.output_dir / BUILD_MANIFEST_NAME
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get('version') != CONVERTER_VERSION:
+            return {}
+        return manifest.get('entries', {})
+
+    def save_build_manifest(self, entries):
+        """Атомарно записує маніфест збірки"""
+        manifest_path = self.output_dir / BUILD_MANIFEST_NAME
+        temp_path = manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CONVERTER_VERSION, 'entries': entries}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+
+    def is_cached(self, manifest, output_path, key):
+        """Перевіряє, чи можна використати вже зібраний PDF"""
+        return self.use_cache and manifest.get(output_path.name) == key and output_path.exists()
+
+    def git(self, *args):
+        """Виконує git у репозиторії writeup'ів і повертає stdout (None, якщо git недоступний чи завершився з помилкою)"""
+        try:
+            result = subprocess.run(
+                ['git', '-C', str(self.repo_path), *args],
+                capture_output=True, check=True
+            )
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return result.stdout.decode('utf-8', errors='surrogateescape')
+
+    def git_dirty_paths(self):
+        """Файли з незакоміченими змінами (індекс, робоча копія, нові файли) відносно кореня git"""
+        output = self.git('status', '--porcelain', '-z', '--untracked-files=all')
+        if output is None:
+            return None
+        paths = []
+        entries = iter(output.split('\0'))
+        for entry in entries:
+            if not entry:
+                continue
+            paths.append(entry[3:])
+            if entry[0] in 'RC':
+                paths.append(next(entries, ''))  # Після перейменування йде старий шлях
+        return [path for path in paths if path]
+
+    def git_build_state(self):
+        """Поточний стан репозиторію для запису після збірки або None, якщо це не git"""
+        head = self.git('rev-parse', 'HEAD')
+        dirty = self.git_dirty_paths()
+        if head is None or dirty is None:
+            return None
+        return {'commit': head.strip(), 'dirty': dirty, 'settings': self.build_settings_key()}
 
-            # Конвертуємо в HTML
-            html_content = self.markdown_to_html(processed_markdown)
+    def git_changed_paths(self, state):
+        """Абсолютні шляхи файлів, змінених з останньої збірки, за git.
 
-            # Створюємо PDF
-            output_filename = f"{challenge['category']}_{challenge['name'].replace(' ', '_')}.pdf"
-            output_path = self.output_dir / output_filename
+        Повертає None, якщо вибрати змінені задачі неможливо і потрібна повна перевірка:
+        немає запису про попередню збірку, змінились налаштування, коміт не є предком HEAD.
+        """
+        try:
+            with open(self.output_dir / LAST_BUILD_COMMIT_NAME, 'r', encoding='utf-8') as f:
+                last = json.load(f)
+        except (OSError, ValueError):
+            print("🔀 Попередня збірка не записана, перевіряю всі задачі")
+            return None
+
+        if last.get('settings') != state['settings']:
+            print("🔀 Налаштування змінились з попередньої збірки, перевіряю всі задачі")
+            return None
+        if self.git('merge-base', '--is-ancestor', last.get('commit', ''), state['commit']) is None:
+            print("🔀 Коміт попередньої збірки не є предком HEAD, перевіряю всі задачі")
+            return None
+
+        diff = self.git('diff', '--name-only', '--no-renames', '-z', last['commit'], state['commit'])
+        toplevel = self.git('rev-parse', '--show-toplevel')
+        if diff is None or toplevel is None:
+            return None
+
+        # Незакомічені зміни минулої збірки теж могли змінитись чи відкотитись
+        relative_paths = set(diff.split('\0')) | set(last.get('dirty', [])) | set(state['dirty'])
+        root = Path(toplevel.strip())
+        output_dir = self.output_dir.resolve()  # Папка результатів може лежати всередині репозиторію
+        changed_paths = {(root / path).resolve() for path in relative_paths if path}
+        return {path for path in changed_paths if output_dir not in path.parents}
+
+    def git_unchanged_challenges(self, challenges, state):
+        """Назви PDF задач, яких не торкались зміни з останньої збірки (порожня множина - перевіряти всі)"""
+        changed_paths = self.git_changed_paths(state)
+        if changed_paths is None:
+            return set()
+
+        # Зображення поза папками задач (спільні ../shared/logo.png) можуть бути в будь-якому writeup'і
+        challenge_dirs = [challenge['path'].resolve() for challenge in challenges]
+        for path in changed_paths:
+            if path.suffix.lower() in MIME_TYPES and not any(
+                challenge_dir in path.parents for challenge_dir in challenge_dirs
+            ):
+                print(f"🔀 Змінено спільне зображення {path.name}, перевіряю всі задачі")
+                return set()
+
+        affected = {self.output_path_for(challenge).name
+                    for challenge in self.affected_challenges(challenges, changed_paths)}
+        print(f"🔀 git: змінено {len(changed_paths)} файлів, зачеплено {len(affected)} задач")
+        return {self.output_path_for(challenge).name for challenge in challenges} - affected
+
+    def save_git_build_state(self, state):
+        """Записує коміт, з якого зроблено збірку"""
+        state_path = self.output_dir / LAST_BUILD_COMMIT_NAME
+        temp_path = state_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=1)
+        os.replace(temp_path, state_path)
+
+    def load_build_journal(self):
+        """Читає журнал перерваного запуску: {назва PDF: ключ збірки}"""
+        entries = {}
+        try:
+            with open(self.output_dir / BUILD_JOURNAL_NAME, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Останній рядок міг обірватися при вбивстві процесу
+                    if record.get('version') == CONVERTER_VERSION:
+                        entries[record['output']] = record['key']
+        except OSError:
+            pass
+        return entries
+
+    def open_journal(self):
+        """Відкриває журнал для дописування (процеси-шарди пишуть у той самий файл)"""
+        self.journal = open(self.output_dir / BUILD_JOURNAL_NAME, 'a', encoding='utf-8')
+
+    def record_journal(self, output_path, key):
+        """Записує готову задачу в журнал одразу після рендеру"""
+        if self.journal is None or key is None:
+            return
+        record = {'version': CONVERTER_VERSION, 'output': output_path.name, 'key': key}
+        self.journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.journal.flush()
+
+    def close_journal(self, remove=False):
+        """Закриває журнал; remove=True - запуск завершено і маніфест вже збережено"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if remove:
+            (self.output_dir / BUILD_JOURNAL_NAME).unlink(missing_ok=True)
+
+    def asset_index_for(self, challenge_dir):
+        """Індекс зображень задачі (сканується один раз за запуск)"""
+        key = str(challenge_dir)
+        index = self.asset_indexes.get(key)
+        if index is None:
+            index = self.asset_indexes[key] = AssetIndex(challenge_dir)
+        return index
+
+    def find_image(self, img_path, assets_dir):
+        """Шукає файл зображення для посилання з markdown, повертає Path або None.
+
+        Шукається по всій папці задачі (assets_dir.parent), не лише в assets/.
+        """
+        return self.asset_index_for(assets_dir.parent).find(img_path)
+
+    def process_images_in_markdown(self, markdown_content, assets_dir, stats=None, publish=None, data_urls=None,
+                                   log=print):
+        """Обробляє зображення в markdown: конвертує їх в base64 або,
+        в режимі asset_mode='file', замінює на абсолютні file:// посилання.
+
+        publish (якщо передано) - функція, що копіює зображення кудись і повертає
+        посилання на нього (статичний сайт). Якщо передано список data_urls, base64
+        додається в нього, а в markdown ставиться мітка (див. inline_data_urls).
+        У stats['bytes']['image'] (якщо передано) додається розмір вбудованих зображень.
+        log - куди писати повідомлення (пул підготовки збирає їх, щоб вивести з циклу подій).
+        """
+        # Повторні посилання на те саме зображення обробляються один раз
+        resolved = {}
 
-            # Створюємо тимчасовий HTML файл
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-                f.write(html_content)
-                temp_html_path = f.name
+        def replace_image(match):
+            alt_text = match.group(1) if match.group(1) else ""
+            img_path = match.group(2)
+
+            if img_path.startswith(('http://', 'https://', 'data:')):
+                return match.group(0)  # Зовнішні та вже вбудовані зображення не чіпаємо
+
+            if img_path in resolved:
+                target = resolved[img_path]
+                return f'![{alt_text}]({target})' if target else match.group(0)
+
+            log(f"🔍 Обробляю зображення: {img_path}")
+
+            full_img_path = self.find_image(img_path, assets_dir)
+            resolved[img_path] = None
+            if full_img_path is None:
+                log(f"⚠️  Зображення не знайдено: {img_path}")
+                return match.group(0)  # Повертаємо оригінальний текст якщо не знайшли
 
             try:
-                # Створюємо нову сторінку
-                page = await browser.new_page()
+                log(f"✅ Знайдено зображення: {full_img_path}")
+
+                # Зменшуємо та перестискаємо зображення (з кешем на диску)
+                mime_type = MIME_TYPES.get(full_img_path.suffix.lower(), 'image/png')
+                if self.image_optimizer:
+                    try:
+                        full_img_path, mime_type = self.image_optimizer.optimize(full_img_path)
+                    except Exception as e:
+                        log(f"⚠️  Не вдалося оптимізувати {full_img_path}, вбудовую як є: {e}")
+
+                if publish is not None:
+                    resolved[img_path] = publish(full_img_path)
+                    return f'![{alt_text}]({resolved[img_path]})'
+
+                if self.asset_mode == 'file':
+                    # Chromium сам прочитає файл, у пам'яті залишається лише посилання
+                    resolved[img_path] = full_img_path.resolve().as_uri()
+                    return f'![{alt_text}]({resolved[img_path]})'
+
+                # Конвертуємо зображення в base64
+                with open(full_img_path, 'rb') as img_file:
+                    img_data = img_file.read()
+                if stats is not None:
+                    stats['bytes']['image'] += len(img_data)
+
+                # Створюємо base64 data URL
+                base64_data = base64.b64encode(img_data).decode('utf-8')
+                resolved[img_path] = f'data:{mime_type};base64,{base64_data}'
+                if data_urls is not None:
+                    data_urls.append(resolved[img_path])
+                    resolved[img_path] = f"{INLINE_IMAGE_PLACEHOLDER}{len(data_urls) - 1}"
+                return f'![{alt_text}]({resolved[img_path]})'
+
+            except Exception as e:
+                log(f"❌ Помилка обробки зображення {full_img_path}: {e}")
+                return match.group(0)
+
+        # Знаходимо всі markdown зображення
+        processed_content = IMAGE_PATTERN.sub(replace_image, markdown_content)
+
+        return processed_content
 
-                # Завантажуємо HTML
-                await page.goto(f'file://{temp_html_path}')
+    def markdown_to_html(self, markdown_content):
+        """Конвертує markdown в HTML з підтримкою синтаксису коду"""
+        return self.renderer.render(markdown_content)
+
+    def inline_data_urls(self, html_content, data_urls):
+        """Підставляє data: URL зображень замість міток з process_images_in_markdown"""
+        if not data_urls:
+            return html_content
+        return INLINE_IMAGE_PATTERN.sub(lambda match: f'src="{data_urls[int(match.group(1))]}"', html_content)
+
+    async def _print_html_to_pdf(self, browser, html_content, output_path=None, timings=None, timeout=None,
+                                 **pdf_options):
+        """Друкує HTML документ у PDF на окремій сторінці браузера.
+
+        Повертає байти PDF; якщо передано output_path, PDF також записується у файл.
+        У timings (якщо передано) записується час етапів goto та pdf.
+        Після тайм-ауту (page_timeout секунд на кожен етап) кидається asyncio.TimeoutError.
+        """
+        if timings is None:
+            timings = {}
+
+        if self.pdf_backend:
+            with stage_timer(timings, 'pdf'):
+                return self.pdf_backend.render(html_content, output_path)
+
+        # Сторінка з http:// адресою не може читати file://, тому локальні зображення
+        # теж віддаються через віртуальну адресу. Віддаються лише файли, на які посилається
+        # сам документ, а не будь-який шлях, який запросить сторінка
+        allowed_files = set()
+        if self.asset_mode == 'file':
+            def to_virtual(match):
+                uri_path = urllib.parse.urlsplit(html.unescape(match.group(1))).path
+                allowed_files.add(urllib.parse.unquote(uri_path))
+                return f'src="{VIRTUAL_ORIGIN}{VIRTUAL_FILE_PREFIX}{match.group(1)}"'
+
+            html_content = FILE_SRC_PATTERN.sub(to_virtual, html_content)
+        document = html_content.encode('utf-8')
+
+        async def serve(route):
+            path = urllib.parse.urlsplit(route.request.url).path
+            if path.startswith(VIRTUAL_FILE_PREFIX + '/'):
+                file_path = urllib.parse.unquote(path[len(VIRTUAL_FILE_PREFIX):])
+                if file_path in allowed_files and Path(file_path).is_file():
+                    await route.fulfill(path=file_path)
+                else:
+                    await route.fulfill(status=404)
+            else:
+                await route.fulfill(body=document, content_type='text/html; charset=utf-8')
 
-                # Генеруємо PDF
-                await page.pdf(
-                    path=str(output_path),
+        # timeout - власний тайм-аут для великих документів (книга), інакше page_timeout
+        timeout = (timeout if timeout is not None else self.page_timeout) or None
+        page = None
+        try:
+            # Створюємо нову сторінку
+            page = await browser.new_page()
+
+            # Віддаємо HTML з пам'яті через перехоплену віртуальну адресу
+            with stage_timer(timings, 'goto'):
+                await page.route(f"{VIRTUAL_ORIGIN}/**", serve)
+                # Власний тайм-аут навігації Playwright (30 с) інакше спрацював би раніше за наш;
+                # 0 його вимикає
+                await asyncio.wait_for(
+                    page.goto(f"{VIRTUAL_ORIGIN}/index.html", timeout=(timeout or 0) * 1000), timeout
+                )
+
+            # Генеруємо PDF
+            with stage_timer(timings, 'pdf'):
+                pdf_data = await asyncio.wait_for(page.pdf(
+                    path=str(output_path) if output_path else None,
                     format='A4',
                     margin={
                         'top': '2cm',
@@ -341,25 +1893,151 @@ class CTFWriteupConverter:
                         'bottom': '2cm',
                         'left': '2cm'
                     },
-                    print_background=True
-                )
+                    print_background=True,
+                    **pdf_options
+                ), timeout)
+
+        finally:
+            # Закриваємо сторінку і після помилки чи тайм-ауту, щоб вона не залишилась у браузері
+            if page is not None:
+                with contextlib.suppress(Exception):
+                    await asyncio.wait_for(page.close(), 10)
+
+        return pdf_data
+
+    async def print_with_retries(self, browser, html_content, output_path=None, timings=None, stats=None,
+                                 **pdf_options):
+        """_print_html_to_pdf з повторними спробами; якщо браузер впав, він перезапускається"""
+        attempts = self.retries + 1
+        for attempt in range(1, attempts + 1):
+            if stats is not None:
+                stats['attempts'] = attempt
+            try:
+                return await self._print_html_to_pdf(browser, html_content, output_path, timings, **pdf_options)
+            except Exception as e:
+                if attempt == attempts:
+                    raise
+                reason = "тайм-аут" if isinstance(e, asyncio.TimeoutError) else e
+                print(f"🔁 Спроба {attempt}/{attempts} не вдалася ({reason}), повторюю...")
+                if browser is not None and not browser.is_connected():
+                    browser = await self.restart_browser(browser)
+
+    async def restart_browser(self, browser):
+        """Запускає новий Chromium замість того, що впав.
+
+        Перезапускається лише браузер, запущений browser_session; якщо інша задача
+        вже перезапустила його, повертається новий браузер.
+        """
+        async with self._restart_lock:
+            if self._browser is not browser:
+                return self._browser or browser
+            print("⚠️  Браузер впав, запускаю новий")
+            with contextlib.suppress(Exception):
+                await browser.close()
+            self._browser = await self._playwright.chromium.launch()
+            return self._browser
+
+    def build_challenge_markdown(self, challenge):
+        """Читає README.md задачі та додає заголовок з інформацією про задачу"""
+        # Читаємо markdown файл
+        with open(challenge['readme'], 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+
+        # Додаємо заголовок з інформацією про задачу
+        header = f"""# {challenge['name']}
 
-                await page.close()
+**Категорія:** {challenge['category']}
 
-            finally:
-                # Видаляємо тимчасовий файл
-                os.unlink(temp_html_path)
+---
+
+"""
+        return header + markdown_content
+
+    def prepare_challenge(self, challenge, with_key=False):
+        """CPU частина конвертації: читання README.md, зображення, markdown → HTML.
+
+        Виконується в пулі (потік або процеси), поки браузер друкує інші задачі.
+        Повертає словник з HTML, ключем збірки для журналу (якщо with_key),
+        часом і розмірами етапів та повідомленнями (log), які виводить вже викликач:
+        print з потоку пулу перемішувався б з виводом циклу подій.
+        """
+        prepared = {'timings': {}, 'bytes': {'image': 0}, 'key': None, 'log': []}
+        timings = prepared['timings']
+
+        # Ключ для журналу рахуємо до рендеру: зміни під час рендеру не потраплять у кеш
+        if with_key:
+            prepared['key'] = self.compute_build_key(challenge)
+
+        with stage_timer(timings, 'read'):
+            # Документи з stream() можуть передавати markdown напряму, без README.md
+            if 'markdown' in challenge:
+                markdown_content = challenge['markdown']
+            else:
+                markdown_content = self.build_challenge_markdown(challenge)
+        prepared['bytes']['markdown'] = len(markdown_content.encode('utf-8'))
+
+        # Обробляємо зображення
+        assets_dir = challenge['path'] / 'assets'
+        data_urls = []
+        with stage_timer(timings, 'images'):
+            processed_markdown = self.process_images_in_markdown(
+                markdown_content, assets_dir, prepared, data_urls=data_urls, log=prepared['log'].append
+            )
+
+        # Конвертуємо в HTML
+        with stage_timer(timings, 'markdown'):
+            html_content = self.inline_data_urls(self.markdown_to_html(processed_markdown), data_urls)
+        prepared['bytes']['html'] = len(html_content)
+        prepared['html'] = html_content
+        return prepared
+
+    async def convert_to_pdf(self, challenge, browser, prepared=None):
+        """Конвертує один writeup в PDF, повертає шлях до PDF або None при помилці.
+
+        prepared - future з результатом prepare_challenge, запущеним заздалегідь
+        у пулі; без нього HTML готується тут же.
+        """
+        output_path = self.output_path_for(challenge)
+        stats = {
+            'challenge': f"{challenge['category']}/{challenge['name']}",
+            'output': output_path.name,
+            'timings': {},
+            'bytes': {'image': 0},
+        }
+        self.stats.append(stats)
+        timings = stats['timings']
+
+        try:
+            print(f"Обробляю: {challenge['category']} - {challenge['name']}")
+
+            if prepared is None:
+                prepared = self.prepare_challenge(challenge, with_key=self.journal is not None)
+            else:
+                prepared = await prepared
+            for line in prepared.pop('log'):
+                print(line)
+            timings.update(prepared['timings'])
+            stats['bytes'].update(prepared['bytes'])
+
+            # Створюємо PDF
+            await self.print_with_retries(browser, prepared.pop('html'), output_path, timings=timings, stats=stats)
+            stats['bytes']['pdf'] = output_path.stat().st_size
+            self.record_journal(output_path, prepared['key'])
 
             print(f"✅ Створено: {output_path}")
-            self.generated_pdfs.append(output_path)  # Додаємо до списку
-            return True
+            return output_path
 
         except Exception as e:
-            print(f"❌ Помилка при обробці {challenge['name']}: {e}")
-            return False
+            stats['error'] = str(e).strip() or type(e).__name__
+            print(f"❌ Помилка при обробці {challenge['name']}: {e!r}")
+            return None
 
-    async def create_index_pdf(self, challenges, browser):
-        """Створює індексний PDF з переліком всіх задач"""
+    def build_index_markdown(self, challenges, page_numbers=None, links=None):
+        """Формує markdown індексу з переліком всіх задач.
+
+        page_numbers - словник {(категорія, назва): номер сторінки} для режиму книги,
+        links - словник {(категорія, назва): посилання} для статичного сайту.
+        """
         index_content = """# CTF Writeups Collection
 
 ## Список задач
@@ -377,69 +2055,85 @@ class CTFWriteupConverter:
         for category, names in sorted(categories.items()):
             index_content += f"\n### {category.upper()}\n\n"
             for name in sorted(names):
-                index_content += f"- {name}\n"
+                if links is not None:
+                    label = name.replace('[', '\\[').replace(']', '\\]')
+                    index_content += f"- [{label}]({links[(category, name)]})\n"
+                elif page_numbers is None:
+                    index_content += f"- {name}\n"
+                else:
+                    index_content += f"- {name} — стор. {page_numbers[(category, name)]}\n"
 
         index_content += f"\n\n**Всього задач:** {len(challenges)}\n"
         index_content += f"**Категорій:** {len(categories)}\n\n"
         index_content += "---\n\n*Згенеровано автоматично*"
+        return index_content
+
+    async def create_index_pdf(self, challenges, browser):
+        """Створює індексний PDF з переліком всіх задач"""
+        index_content = self.build_index_markdown(challenges)
 
         # Конвертуємо в PDF
         html_content = self.markdown_to_html(index_content)
         output_path = self.output_dir / "_INDEX.pdf"
 
-        # Створюємо тимчасовий HTML файл
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-            f.write(html_content)
-            temp_html_path = f.name
-
-        try:
-            page = await browser.new_page()
-            await page.goto(f'file://{temp_html_path}')
-            await page.pdf(
-                path=str(output_path),
-                format='A4',
-                margin={'top': '2cm', 'right': '2cm', 'bottom': '2cm', 'left': '2cm'},
-                print_background=True
-            )
-            await page.close()
-        finally:
-            os.unlink(temp_html_path)
+        await self.print_with_retries(browser, html_content, output_path)
 
         print(f"📋 Створено індекс: {output_path}")
-        self.generated_pdfs.append(output_path)  # Додаємо індекс до списку
+        return output_path
+
+    def create_separator_pages(self, titles):
+        """Створює сторінки-роздільники для всіх заголовків за один прохід reportlab.
 
-    def create_separator_page(self, title, output_path):
-        """Створює сторінку-роздільник між PDF файлами"""
+        Повертає PdfReader над PDF у пам'яті (сторінка i відповідає titles[i]) або None.
+        """
         if not MERGE_AVAILABLE:
             return None
 
         try:
-            c = canvas.Canvas(str(output_path), pagesize=A4)
+            buffer = io.BytesIO()
+            c = canvas.Canvas(buffer, pagesize=A4)
             width, height = A4
 
-            # Встановлюємо фон
-            c.setFillColorRGB(0.2, 0.3, 0.5)  # Темно-синій фон
-            c.rect(0, 0, width, height, fill=True)
+            for title in titles:
+                # Встановлюємо фон
+                c.setFillColorRGB(0.2, 0.3, 0.5)  # Темно-синій фон
+                c.rect(0, 0, width, height, fill=True)
+
+                # Заголовок
+                c.setFillColorRGB(1, 1, 1)  # Білий текст
+                c.setFont("Helvetica-Bold", 24)
+                text_width = c.stringWidth(title, "Helvetica-Bold", 24)
+                c.drawString((width - text_width) / 2, height / 2, title)
 
-            # Заголовок
-            c.setFillColorRGB(1, 1, 1)  # Білий текст
-            c.setFont("Helvetica-Bold", 24)
-            text_width = c.stringWidth(title, "Helvetica-Bold", 24)
-            c.drawString((width - text_width) / 2, height / 2, title)
+                # Лінія під заголовком
+                c.setStrokeColorRGB(1, 1, 1)
+                c.setLineWidth(2)
+                line_start = (width - text_width) / 2
+                line_end = line_start + text_width
+                c.line(line_start, height / 2 - 10, line_end, height / 2 - 10)
 
-            # Лінія під заголовком
-            c.setStrokeColorRGB(1, 1, 1)
-            c.setLineWidth(2)
-            line_start = (width - text_width) / 2
-            line_end = line_start + text_width
-            c.line(line_start, height / 2 - 10, line_end, height / 2 - 10)
+                c.showPage()
 
             c.save()
-            return output_path
+            buffer.seek(0)
+            return PdfReader(buffer)
         except Exception as e:
-            print(f"❌ Помилка створення сторінки-роздільника: {e}")
+            print(f"❌ Помилка створення сторінок-роздільників: {e}")
             return None
 
+    def separator_title(self, pdf_path):
+        """Заголовок сторінки-роздільника для PDF файлу"""
+        if pdf_path.name == "_INDEX.pdf":
+            return "📋 ІНДЕКС"
+        return f"📄 {pdf_path.stem.replace('_', ' ').title()}"
+
+    def sorted_pdfs_for_merge(self):
+        """PDF файли в порядку об'єднання (індекс спочатку, потім по алфавіту)"""
+        return sorted(
+            (pdf_path for pdf_path in self.generated_pdfs if pdf_path.exists()),
+            key=lambda x: (0 if x.name == "_INDEX.pdf" else 1, x.name)
+        )
+
     def merge_pdfs(self):
         """Об'єднує всі PDF файли в один"""
         if not MERGE_AVAILABLE:
@@ -451,46 +2145,40 @@ class CTFWriteupConverter:
             print("❌ Немає PDF файлів для об'єднання")
             return False
 
+        if self.split_by:
+            return self.merge_volumes()
+
+        if self.merge_mode == 'stream':
+            # Якщо змінилась лише частина writeup'ів, дописуємо тільки їх (інкрементне оновлення PDF)
+            if not self.optimize_pdf and self.merge_pdfs_incremental():
+                return True
+            return self.merge_pdfs_streaming()
+
+        # PdfWriter нумерує об'єкти по-своєму, тож карта розділів більше не дійсна
+        (self.output_dir / MERGE_MAP_NAME).unlink(missing_ok=True)
+
         try:
             print("\n🔗 Починаю об'єднання PDF файлів...")
 
             writer = PdfWriter()
             merged_path = self.output_dir / "ALL_WRITEUPS_MERGED.pdf"
 
-            # Сортуємо PDF файли (індекс спочатку, потім по алфавіту)
-            sorted_pdfs = sorted(self.generated_pdfs, key=lambda x: (
-                0 if x.name == "_INDEX.pdf" else 1,
-                x.name
-            ))
-
-            for pdf_path in sorted_pdfs:
-                if not pdf_path.exists():
-                    continue
+            sorted_pdfs = self.sorted_pdfs_for_merge()
+            separators = self.create_separator_pages([self.separator_title(p) for p in sorted_pdfs])
 
+            for position, pdf_path in enumerate(sorted_pdfs):
                 try:
-                    # Створюємо сторінку-роздільник
-                    separator_name = pdf_path.stem.replace('_', ' ').title()
-                    if pdf_path.name == "_INDEX.pdf":
-                        separator_name = "📋 ІНДЕКС"
-                    else:
-                        separator_name = f"📄 {separator_name}"
-
-                    temp_separator = self.output_dir / f"temp_separator_{pdf_path.stem}.pdf"
-                    separator_path = self.create_separator_page(separator_name, temp_separator)
-
                     # Додаємо роздільник
-                    if separator_path and separator_path.exists():
-                        with open(separator_path, 'rb') as sep_file:
-                            sep_reader = PdfReader(sep_file)
-                            for page in sep_reader.pages:
-                                writer.add_page(page)
-                        os.unlink(separator_path)  # Видаляємо тимчасовий файл
+                    if separators:
+                        writer.add_page(separators.pages[position])
 
                     # Додаємо основний PDF
+                    started = time.perf_counter()
                     with open(pdf_path, 'rb') as pdf_file:
                         reader = PdfReader(pdf_file)
                         for page_num, page in enumerate(reader.pages):
                             writer.add_page(page)
+                    self.merge_timings[pdf_path.name] = time.perf_counter() - started
 
                     print(f"✅ Додано: {pdf_path.name}")
 
@@ -504,18 +2192,968 @@ class CTFWriteupConverter:
 
             print(f"\n🎉 Успішно створено об'єднаний PDF: {merged_path}")
             print(f"📊 Загальна кількість сторінок: {len(writer.pages)}")
+            if self.optimize_pdf:
+                self.optimize_merged_pdf(merged_path)
+            self.print_peak_memory()
             return True
 
         except Exception as e:
             print(f"❌ Помилка при об'єднанні PDF: {e}")
             return False
 
-    async def run(self):
-        """Основна функція запуску"""
+    def merge_pdfs_streaming(self):
+        """Об'єднує PDF файли потоково: кожен документ копіюється у вихідний файл
+        одразу після читання, тож пам'ять обмежена найбільшим окремим writeup'ом"""
+        try:
+            print("\n🔗 Починаю потокове об'єднання PDF файлів...")
+
+            merged_path = self.output_dir / "ALL_WRITEUPS_MERGED.pdf"
+            temp_path = merged_path.with_suffix('.pdf.tmp')
+
+            sorted_pdfs = self.sorted_pdfs_for_merge()
+            separators = self.create_separator_pages([self.separator_title(p) for p in sorted_pdfs])
+            separator_objects = {}  # Спільні шрифти роздільників пишемо лише раз
+
+            with open(temp_path, 'wb') as output_file:
+                writer = StreamingPdfWriter(output_file)
+                sections = [
+                    self.write_merge_section(writer, pdf_path, separators, position, separator_objects)
+                    for position, pdf_path in enumerate(sorted_pdfs)
+                ]
+                writer.close()
+
+            os.replace(temp_path, merged_path)
+            self.save_merge_map(merged_path, writer, sections, garbage_bytes=0)
+
+            print(f"\n🎉 Успішно створено об'єднаний PDF: {merged_path}")
+            print(f"📊 Загальна кількість сторінок: {writer.page_count}")
+            if self.optimize_pdf:
+                self.optimize_merged_pdf(merged_path)
+            self.print_peak_memory()
+            return True
+
+        except Exception as e:
+            print(f"❌ Помилка при об'єднанні PDF: {e}")
+            return False
+
+    def write_merge_section(self, writer, pdf_path, separators, position, separator_objects):
+        """Дописує роздільник і сторінки одного PDF, повертає запис для карти розділів"""
+        first_page = writer.page_count
+        start_offset = writer.stream.tell()
+        try:
+            # Додаємо роздільник
+            if separators:
+                writer.add_page(separators.pages[position], separator_objects)
+
+            # Додаємо основний PDF
+            started = time.perf_counter()
+            with open(pdf_path, 'rb') as pdf_file:
+                writer.add_document(PdfReader(pdf_file))
+            self.merge_timings[pdf_path.name] = time.perf_counter() - started
+
+            print(f"✅ Додано: {pdf_path.name}")
+
+        except Exception as e:
+            print(f"⚠️  Помилка при додаванні {pdf_path.name}: {e}")
+
+        source = pdf_path.stat()
+        return {
+            'name': pdf_path.name,
+            'source': [source.st_size, source.st_mtime_ns],
+            'pages': writer.page_numbers[first_page:],
+            'bytes': writer.stream.tell() - start_offset,
+        }
+
+    def load_merge_map(self, merged_path):
+        """Читає карту розділів, якщо вона відповідає поточному об'єднаному PDF.
+
+        Якщо попереднє дописування перервали (файл довший за записаний у карті, а байти
+        на місці старого кінця збігаються), файл обрізається до останньої цілісної версії.
+        """
+        try:
+            with open(self.output_dir / MERGE_MAP_NAME, 'r', encoding='utf-8') as f:
+                merge_map = json.load(f)
+            merged_stat = merged_path.stat()
+        except (OSError, ValueError):
+            return None
+
+        if merge_map.get('version') != CONVERTER_VERSION:
+            return None
+        if merge_map.get('merged') == [merged_stat.st_size, merged_stat.st_mtime_ns]:
+            return merge_map
+
+        # Файл змінили поза нами (інший режим, оптимізація, ручне редагування) або дописування перервали
+        size = merge_map['merged'][0]
+        if merged_stat.st_size < size or self.read_merge_tail(merged_path, size) != merge_map.get('tail'):
+            return None
+        if merged_stat.st_size > size:
+            print("🩹 Попереднє оновлення об'єднаного PDF перервано, повертаю останню цілісну версію")
+            with open(merged_path, 'r+b') as merged_file:
+                merged_file.truncate(size)
+                os.fsync(merged_file.fileno())
+        return merge_map
+
+    def read_merge_tail(self, merged_path, size):
+        """Останні MERGE_TAIL_BYTES байтів перших size байтів файлу (hex)"""
+        with open(merged_path, 'rb') as merged_file:
+            merged_file.seek(max(0, size - MERGE_TAIL_BYTES))
+            return merged_file.read(min(size, MERGE_TAIL_BYTES)).hex()
+
+    def save_merge_map(self, merged_path, writer, sections, garbage_bytes):
+        """Записує карту розділів після повного або інкрементного об'єднання"""
+        merged_stat = merged_path.stat()
+        merge_map = {
+            'version': CONVERTER_VERSION,
+            'merged': [merged_stat.st_size, merged_stat.st_mtime_ns],
+            'tail': self.read_merge_tail(merged_path, merged_stat.st_size),
+            'xref_offset': writer.xref_offset,
+            'next_number': writer.next_number,
+            'garbage_bytes': garbage_bytes,
+            'sections': sections,
+        }
+        map_path = self.output_dir / MERGE_MAP_NAME
+        temp_path = map_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(merge_map, f)
+        os.replace(temp_path, map_path)
+
+    def merge_pdfs_incremental(self):
+        """Оновлює об'єднаний PDF, дописуючи в кінець лише змінені writeup'и.
+
+        Незмінені розділи залишаються на місці, нове дерево сторінок і секція xref
+        з /Prev дописуються в кінець файлу (інкрементне оновлення PDF), тож вартість
+        пропорційна зміненим writeup'ам. Дописування йде в сам файл; карта розділів (розмір
+        і кінець цілісної версії, зсув xref) переписується лише після fsync, тож після
+        перерваного запуску load_merge_map обрізає файл до попередньої версії. Повертає
+        False, якщо потрібне повне об'єднання:
+        карти розділів немає, файл змінено поза нами або мертвих даних стало забагато.
+        """
+        merged_path = self.output_dir / "ALL_WRITEUPS_MERGED.pdf"
+        merge_map = self.load_merge_map(merged_path)
+        if merge_map is None:
+            return False
+
+        sorted_pdfs = self.sorted_pdfs_for_merge()
+        old_sections = {section['name']: section for section in merge_map['sections']}
+
+        def unchanged(pdf_path):
+            section = old_sections.get(pdf_path.name)
+            source = pdf_path.stat()
+            return section is not None and section['source'] == [source.st_size, source.st_mtime_ns]
+
+        changed = [pdf_path for pdf_path in sorted_pdfs if not unchanged(pdf_path)]
+        kept_names = {pdf_path.name for pdf_path in sorted_pdfs} - {pdf_path.name for pdf_path in changed}
+        if not changed and [section['name'] for section in merge_map['sections']] == [p.name for p in sorted_pdfs]:
+            print("♻️  Об'єднаний PDF вже містить актуальні версії всіх writeup'ів")
+            return True
+
+        # Старі версії змінених і видалених розділів залишаються у файлі як мертві дані
+        garbage_bytes = merge_map['garbage_bytes'] + sum(
+            section['bytes'] for name, section in old_sections.items() if name not in kept_names
+        )
+        expected_size = merge_map['merged'][0] + sum(pdf_path.stat().st_size for pdf_path in changed)
+        if garbage_bytes > MERGE_GARBAGE_LIMIT * expected_size:
+            print("🧹 Забагато замінених розділів, перезаписую об'єднаний PDF повністю")
+            return False
+
+        print(f"\n🔗 Оновлюю об'єднаний PDF: {len(changed)} з {len(sorted_pdfs)} розділів")
+        original_size = merge_map['merged'][0]
+        try:
+            changed_names = {pdf_path.name for pdf_path in changed}
+            separators = self.create_separator_pages([self.separator_title(p) for p in changed])
+            separator_objects = {}
+
+            with open(merged_path, 'r+b') as output_file:
+                output_file.seek(original_size)
+                writer = StreamingPdfWriter(
+                    output_file, next_number=merge_map['next_number'], previous_xref=merge_map['xref_offset']
+                )
+                sections = []
+                try:
+                    for pdf_path in sorted_pdfs:
+                        if pdf_path.name not in changed_names:
+                            # Незмінений розділ: лише посилання на вже записані сторінки
+                            section = old_sections[pdf_path.name]
+                            writer.page_numbers.extend(section['pages'])
+                            sections.append(section)
+                            continue
+                        position = changed.index(pdf_path)
+                        sections.append(
+                            self.write_merge_section(writer, pdf_path, separators, position, separator_objects)
+                        )
+                    writer.close()
+                    # Нова карта посилається на дописані дані, тож вони мають бути на диску раніше
+                    output_file.flush()
+                    os.fsync(output_file.fileno())
+                except BaseException:
+                    # Повертаємо файл до попередньої цілісної версії
+                    output_file.truncate(original_size)
+                    raise
+
+            # Якщо карту не встигли переписати, стара карта поверне файл до попередньої версії
+            self.save_merge_map(merged_path, writer, sections, garbage_bytes)
+        except Exception as e:
+            print(f"⚠️  Інкрементне оновлення не вдалося ({e}), перезаписую повністю")
+            return False
+
+        print(f"\n🎉 Оновлено об'єднаний PDF: {merged_path}")
+        print(f"📊 Загальна кількість сторінок: {writer.page_count}")
+        self.print_peak_memory()
+        return True
+
+    def plan_volumes(self, pdf_paths):
+        """Розподіляє PDF задач по томах: [(назва файлу тому, [PDF, ...], індекс тому або None), ...].
+
+        'category' - том на кожну категорію; 'pages' і 'size' - томи по порядку,
+        поки не вичерпано бюджет volume_limit сторінок чи мегабайт разом з роздільниками
+        та індексом тому. Індекс росте з томом: межу тому вгадуємо за вартістю індексу
+        на один запис з попереднього верстання і перевіряємо бінарним пошуком, тож
+        на том зазвичай потрібно два верстання індексу, а не одне на кожного кандидата.
+        Зверстаний індекс (байти PDF) передається процесу тому, щоб не верстати його вдруге.
+        Writeup, більший за бюджет, займає окремий том.
+        """
+        if self.split_by == 'category':
+            volumes = {}
+            for pdf_path in pdf_paths:
+                category = self.pdf_challenges.get(pdf_path.name, {}).get('category') or pdf_path.stem.split('_', 1)[0]
+                volumes.setdefault(category, []).append(pdf_path)
+            return [
+                (f"ALL_WRITEUPS_{category.replace('/', '_')}.pdf", paths, None)
+                for category, paths in sorted(volumes.items())
+            ]
+
+        # Вартість кожного PDF рахується один раз
+        if self.split_by == 'pages':
+            costs = []
+            for pdf_path in pdf_paths:
+                with open(pdf_path, 'rb') as pdf_file:
+                    costs.append(len(PdfReader(pdf_file).pages) + 1)  # + роздільник
+        else:
+            costs = [pdf_path.stat().st_size / (1024 * 1024) for pdf_path in pdf_paths]
+        totals = list(itertools.accumulate(costs, initial=0))
+
+        def render_index(start, end):
+            index_pdf = self.render_volume_index([self.volume_challenge(p) for p in pdf_paths[start:end]])
+            if self.split_by == 'pages':
+                return index_pdf, count_pdf_pages(index_pdf) + 1  # + роздільник індексу
+            return index_pdf, len(index_pdf) / (1024 * 1024)
+
+        budget = self.volume_limit
+        volumes = []
+        index_per_entry = 0
+        start = 0
+        while start < len(pdf_paths):
+            # Верхня межа: скільки writeup'ів вміщається навіть без індексу
+            high = start + 1
+            while high < len(pdf_paths) and totals[high + 1] - totals[start] <= budget:
+                high += 1
+
+            indexes = {}
+
+            def fits(end):
+                if end not in indexes:
+                    indexes[end] = render_index(start, end)
+                return totals[end] - totals[start] + indexes[end][1] <= budget
+
+            # Найбільший том [start, end), що вміщається разом з індексом (вартість монотонна).
+            # Спершу перевіряємо оцінку та наступне за нею значення, далі - бінарний пошук
+            low = start + 1
+            guess = high
+            while guess > low and totals[guess] - totals[start] + index_per_entry * (guess - start) > budget:
+                guess -= 1
+            if guess > low:
+                if fits(guess):
+                    low = guess
+                    if guess < high and not fits(guess + 1):
+                        high = guess
+                else:
+                    high = guess - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if fits(middle):
+                    low = middle
+                else:
+                    high = middle - 1
+
+            # Том з одного writeup'а міг не верстатися: його індекс зверстає процес тому
+            index_pdf = None
+            if low in indexes:
+                index_pdf, index_cost = indexes[low]
+                index_per_entry = index_cost / (low - start)
+            volumes.append((f"ALL_WRITEUPS_VOL{len(volumes) + 1:02d}.pdf", pdf_paths[start:low], index_pdf))
+            start = low
+        return volumes
+
+    def volume_challenge(self, pdf_path):
+        """Категорія та назва задачі PDF для індексу тому (шляхи задач процесу тому не потрібні)"""
+        challenge = (
+            self.pdf_challenges.get(pdf_path.name)
+            or {'category': pdf_path.stem.split('_', 1)[0], 'name': pdf_path.stem}
+        )
+        return {'category': challenge['category'], 'name': challenge['name']}
+
+    def render_volume_index(self, challenges):
+        """Індекс тому як PDF (байти). Верстається reportlab без браузера,
+        тож томи можна будувати в окремих процесах"""
+        return ReportlabBackend().render(self.markdown_to_html(self.build_index_markdown(challenges)))
+
+    def merge_volumes(self):
+        """Об'єднує PDF у кілька томів (--split-by), кожен у власному процесі.
+
+        Кожен процес пише свій том потоково (пам'ять обмежена найбільшим writeup'ом)
+        з власним індексом на початку. Томи, яких більше немає, видаляються.
+        """
+        volumes_dir = self.output_dir / VOLUMES_DIR_NAME
+        volumes_dir.mkdir(exist_ok=True)
+        pdf_paths = [pdf_path for pdf_path in self.sorted_pdfs_for_merge() if pdf_path.name != "_INDEX.pdf"]
+        if not pdf_paths:
+            print("❌ Немає PDF файлів для об'єднання")
+            return False
+
+        volumes = self.plan_volumes(pdf_paths)
+        print(f"\n📚 Об'єдную {len(pdf_paths)} PDF у {len(volumes)} томів...")
+
+        tasks = []
+        for volume_name, paths, index_pdf in volumes:
+            challenges = [self.volume_challenge(pdf_path) for pdf_path in paths]
+            tasks.append((str(volumes_dir / volume_name), [str(pdf_path) for pdf_path in paths], challenges, index_pdf))
+
+        success = True
+        workers = max(1, min(len(tasks), os.cpu_count() or 1))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _build_volume, str(self.output_dir), volume_path, paths, challenges, self.optimize_pdf, index_pdf
+                )
+                for volume_path, paths, challenges, index_pdf in tasks
+            ]
+            for (volume_path, paths, _, _), future in zip(tasks, futures):
+                try:
+                    page_count, timings = future.result()
+                except Exception as e:
+                    print(f"❌ Не вдалося створити том {Path(volume_path).name}: {e}")
+                    success = False
+                    continue
+                self.merge_timings.update(timings)
+                print(f"✅ Том {Path(volume_path).name}: {len(paths)} writeup'ів, {page_count} сторінок, "
+                      f"{Path(volume_path).stat().st_size / 1e6:.1f} MB")
+
+        # Прибираємо томи з попереднього поділу
+        current = {Path(volume_path).name for volume_path, *_ in tasks}
+        for stale_path in volumes_dir.glob("*.pdf"):
+            if stale_path.name not in current:
+                stale_path.unlink()
+
+        print(f"\n🎉 Томи збережено в: {volumes_dir}")
+        self.print_peak_memory()
+        return success
+
+    def build_volume(self, volume_path, pdf_paths, challenges, optimize=False, index_pdf=None):
+        """Пише один том: індекс тому (reportlab), далі роздільники та writeup'и.
+
+        index_pdf - індекс, вже зверстаний при плануванні томів (інакше верстається тут).
+        Повертає кількість сторінок тому.
+        """
+        volume_path = Path(volume_path)
+        temp_path = volume_path.with_suffix('.pdf.tmp')
+
+        if index_pdf is None:
+            index_pdf = self.render_volume_index(challenges)
+        index_reader = PdfReader(io.BytesIO(index_pdf))
+
+        titles = ["📋 ІНДЕКС"] + [self.separator_title(pdf_path) for pdf_path in pdf_paths]
+        separators = self.create_separator_pages(titles)
+        separator_objects = {}
+
+        with open(temp_path, 'wb') as output_file:
+            writer = StreamingPdfWriter(output_file)
+            if separators:
+                writer.add_page(separators.pages[0], separator_objects)
+            writer.add_document(index_reader)
+            for position, pdf_path in enumerate(pdf_paths, 1):
+                self.write_merge_section(writer, pdf_path, separators, position, separator_objects)
+            writer.close()
+
+        if optimize:
+            optimized_path = volume_path.with_suffix('.pdf.opt')
+            optimize_pdf(temp_path, optimized_path)
+            os.replace(optimized_path, temp_path)
+        os.replace(temp_path, volume_path)
+        return writer.page_count
+
+    def optimize_merged_pdf(self, merged_path):
+        """Проходить по об'єднаному PDF ще раз, прибираючи дублікати зображень і шрифтів"""
+        if not MERGE_AVAILABLE:
+            return False
+
+        temp_path = merged_path.with_suffix('.pdf.opt')
+        try:
+            print("🗜️  Оптимізую об'єднаний PDF...")
+            size_before = merged_path.stat().st_size
+            duplicates = optimize_pdf(merged_path, temp_path)
+            size_after = temp_path.stat().st_size
+            os.replace(temp_path, merged_path)
+            # Об'єкти перенумеровано: інкрементно оновлювати такий файл вже не можна
+            (self.output_dir / MERGE_MAP_NAME).unlink(missing_ok=True)
+        except Exception as e:
+            print(f"⚠️  Не вдалося оптимізувати PDF: {e}")
+            temp_path.unlink(missing_ok=True)
+            return False
+
+        print(f"🗜️  Прибрано дублікатів: {duplicates}, розмір "
+              f"{size_before / (1024 * 1024):.1f} MB → {size_after / (1024 * 1024):.1f} MB")
+        return True
+
+    def print_peak_memory(self):
+        """Виводить пікове використання пам'яті процесом (RSS)"""
+        peak_mb = peak_rss_mb()
+        if peak_mb is not None:
+            print(f"🧠 Пікове використання пам'яті: {peak_mb:.1f} MB")
+
+    async def convert_many(self, challenges, browser):
+        """Конвертує список задач, рендерячи до self.jobs сторінок одночасно.
+
+        Повертає список шляхів до PDF (або None для невдалих задач)
+        у тому ж порядку, що й challenges.
+        """
+        semaphore = asyncio.Semaphore(self.jobs)
+        # Задачі, що готуються або вже готові й чекають на друк. Обмежує кількість
+        # HTML документів у пам'яті, а пул тим часом готує наступні задачі
+        in_flight = asyncio.Semaphore(self.jobs * 2 + self.prepare_workers)
+        loop = asyncio.get_running_loop()
+
+        with self.preparation_pool() as (executor, prepare):
+            async def convert_one(challenge):
+                async with in_flight:
+                    prepared = None
+                    if executor is not None:
+                        prepared = loop.run_in_executor(executor, prepare, challenge, self.journal is not None)
+                    async with semaphore:
+                        # Якщо браузер перезапускали, наступні задачі отримують новий
+                        output_path = await self.convert_to_pdf(challenge, self._browser or browser, prepared)
+                if self.on_result:
+                    await self.on_result(challenge, output_path)
+                return output_path
+
+            return await asyncio.gather(*(convert_one(challenge) for challenge in challenges))
+
+    async def stream(self, items, browser=None, write_files=True):
+        """Публічний API для вбудовування: конвертує документи й віддає результати по мірі готовності.
+
+        items - звичайний або асинхронний ітератор задач (як з find_challenge_folders),
+        рядків markdown або словників {'markdown': ..., 'name': ..., 'category': ...,
+        'path': папка з зображеннями}. Документи читаються з items лише коли є місце
+        в конвеєрі; місце звільняється, коли споживач забирає результат, тож ітератор
+        може бути нескінченним, а повільний споживач не накопичує готові PDF у пам'яті.
+
+        Для кожного документа віддається словник: challenge, ok, path (PDF на диску,
+        якщо write_files), pdf (байти PDF, якщо write_files=False), pages, seconds,
+        timings, attempts, error. Результати йдуть у порядку завершення. Помилка
+        ітератора items передається споживачу після результатів вже розпочатих документів.
+
+        Якщо споживач перестав читати (break + aclose(), див. contextlib.aclosing)
+        або задачу скасовано, незавершені конвертації скасовуються, а браузер,
+        запущений тут, закривається.
+        """
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.jobs)
+        in_flight = asyncio.Semaphore(self.jobs * 2 + self.prepare_workers)
+        tasks = set()
+
+        async def convert_one(challenge, prepared, browser):
+            result = await self._convert_for_stream(challenge, prepared, browser, write_files, semaphore)
+            # Слот звільняє споживач, коли забере результат: повільний споживач зупиняє читання items
+            await results.put(result)
+
+        async def feed(browser, executor, prepare):
+            number = 0
+            iterator = items.__aiter__() if hasattr(items, '__aiter__') else None
+            source = iter(items) if iterator is None else None
+            try:
+                while True:
+                    await in_flight.acquire()  # Не беремо наступний документ, доки конвеєр повний
+                    try:
+                        item = await iterator.__anext__() if iterator is not None else next(source)
+                    except (StopAsyncIteration, StopIteration):
+                        in_flight.release()
+                        break
+                    number += 1
+                    challenge = self._stream_challenge(item, number)
+                    prepared = None
+                    if executor is not None:
+                        prepared = loop.run_in_executor(executor, prepare, challenge, False)
+                    task = asyncio.create_task(convert_one(challenge, prepared, browser))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            finally:
+                # Документи, що вже конвертуються, віддаються споживачу і після помилки в items
+                while tasks:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                results.put_nowait(None)  # Споживач завершується і після помилки в items
+
+        async with self.browser_session(browser) as browser:
+            with self.preparation_pool() as (executor, prepare):
+                feeder = asyncio.create_task(feed(browser, executor, prepare))
+                try:
+                    while True:
+                        result = await results.get()
+                        if result is None:
+                            break
+                        yield result
+                        in_flight.release()
+                    await feeder  # Помилка ітератора items передається споживачу
+                finally:
+                    feeder.cancel()
+                    for task in list(tasks):
+                        task.cancel()
+                    await asyncio.gather(feeder, *tasks, return_exceptions=True)
+
+    def _stream_challenge(self, item, number):
+        """Приводить документ для stream() до словника задачі"""
+        if isinstance(item, str):
+            item = {'markdown': item}
+        if 'markdown' not in item:
+            return item
+        challenge = {'category': 'markdown', 'name': f"document {number}", 'path': self.repo_path}
+        challenge.update(item)
+        challenge['path'] = Path(challenge['path'])
+        return challenge
+
+    async def _convert_for_stream(self, challenge, prepared, browser, write_files, semaphore):
+        """Конвертує один документ для stream(); помилки повертаються в результаті"""
+        output_path = self.output_path_for(challenge) if write_files else None
+        stats = {
+            'challenge': f"{challenge['category']}/{challenge['name']}",
+            'output': output_path.name if output_path else None,
+            'timings': {},
+            'bytes': {'image': 0},
+        }
+        # У self.stats не додаємо: items можуть бути нескінченними, а час етапів є в результаті
+        result = {
+            'challenge': stats['challenge'],
+            'ok': False,
+            'path': None,
+            'pdf': None,
+            'pages': None,
+            'seconds': None,
+            'timings': stats['timings'],
+            'attempts': 0,
+            'error': None,
+        }
+        started = time.perf_counter()
+        try:
+            if prepared is None:
+                prepared = self.prepare_challenge(challenge)
+            else:
+                prepared = await prepared
+            for line in prepared.pop('log'):
+                print(line)
+            stats['timings'].update(prepared['timings'])
+            stats['bytes'].update(prepared['bytes'])
+
+            async with semaphore:
+                # Якщо браузер перезапускали, наступні документи отримують новий
+                pdf_data = await self.print_with_retries(
+                    self._browser or browser, prepared.pop('html'), output_path,
+                    timings=stats['timings'], stats=stats
+                )
+            stats['bytes']['pdf'] = len(pdf_data)
+            result.update(ok=True, path=output_path, pages=count_pdf_pages(pdf_data))
+            if not write_files:
+                result['pdf'] = pdf_data
+        except Exception as e:
+            stats['error'] = result['error'] = str(e) or type(e).__name__
+        result['attempts'] = stats.get('attempts', 0)
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        return result
+
+    @contextlib.contextmanager
+    def preparation_pool(self):
+        """Пул для prepare_challenge: (executor, функція) або (None, None) при prepare_workers=0.
+
+        Один фоновий потік звільняє цикл подій для Playwright; кілька процесів
+        (кожен зі своїм конвертером) готують HTML паралельно.
+        """
+        if not self.prepare_workers:
+            yield None, None
+            return
+
+        if self.prepare_workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.prepare_workers, initializer=_init_prepare_worker,
+                initargs=(str(self.repo_path), str(self.output_dir), self.worker_options())
+            )
+            prepare = _prepare_in_worker
+        else:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ctf-prepare")
+            prepare = self.prepare_challenge
+        try:
+            yield executor, prepare
+        finally:
+            # Не чекаємо на підготовку, що вже йде: блокуючий shutdown зупинив би цикл подій
+            # при скасуванні або aclose(). Потік/процеси завершаться самі після поточної задачі
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def worker_options(self):
+        """Параметри конструктора, які потрібно передати процесам-шардам"""
+        options = {
+            'jobs': self.jobs, 'image_dpi': 0, 'asset_mode': self.asset_mode, 'backend': self.backend,
+            'highlight_limit_kb': self.highlight_limit_kb,
+            'page_timeout': self.page_timeout, 'retries': self.retries,
+            'prepare_workers': min(self.prepare_workers, 1),
+        }
+        if self.image_optimizer:
+            options.update(
+                image_dpi=self.image_optimizer.dpi,
+                image_format=self.image_optimizer.image_format,
+                image_quality=self.image_optimizer.quality,
+            )
+        return options
+
+    @contextlib.asynccontextmanager
+    async def browser_session(self, browser=None):
+        """Надає браузер: переданий (теплий) або щойно запущений Chromium.
+
+        З бекендом reportlab та для статичного сайту браузер не потрібен і не запускається.
+        """
+        if browser is not None or self.pdf_backend or self.engine == 'html':
+            yield browser
+            return
+
+        # Запускаємо браузер
+        async with async_playwright() as p:
+            self._playwright = p
+            self._browser = await p.chromium.launch()
+            try:
+                yield self._browser
+            finally:
+                with contextlib.suppress(Exception):
+                    await self._browser.close()  # Міг бути перезапущений або вже впасти
+                self._playwright = self._browser = None
+
+    async def render_challenges(self, challenges, index_challenges=None, browser=None):
+        """Рендерить задачі (та індекс, якщо передано список для нього) у власному
+        або переданому Chromium.
+
+        Повертає (шлях до індексу або None, список результатів convert_many).
+        """
+        index_path = None
+
+        async with self.browser_session(browser) as browser:
+            # Створюємо індекс
+            if index_challenges:
+                try:
+                    index_path = await self.create_index_pdf(index_challenges, browser)
+                except Exception as e:
+                    # Без індексу збірка все одно корисна: задачі рендеримо далі
+                    print(f"❌ Не вдалося створити індекс: {str(e) or type(e).__name__}")
+
+            # Конвертуємо задачі (до self.jobs одночасно)
+            results = await self.convert_many(challenges, browser)
+
+        return index_path, results
+
+    async def render_sharded(self, challenges, index_challenges=None):
+        """Розподіляє задачі між self.shards процесами, кожен зі своїм Chromium.
+
+        Задачі роздаються по колу, щоб великі категорії не потрапили в один шард.
+        Результати повертаються в порядку challenges.
+        """
+        shard_count = min(self.shards, len(challenges))
+        shards = [challenges[i::shard_count] for i in range(shard_count)]
+
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=shard_count) as executor:
+            futures = [
+                loop.run_in_executor(
+                    executor, _render_shard,
+                    str(self.repo_path), str(self.output_dir), shard,
+                    index_challenges if shard_index == 0 else None,
+                    self.worker_options()
+                )
+                for shard_index, shard in enumerate(shards)
+            ]
+            shard_results = await asyncio.gather(*futures)
+
+        index_path = shard_results[0][0]
+        results = [None] * len(challenges)
+        for shard_index, (_, shard_paths, shard_stats) in enumerate(shard_results):
+            self.stats.extend(shard_stats)
+            for position, output_path in enumerate(shard_paths):
+                results[shard_index + position * shard_count] = output_path
+
+        return index_path, results
+
+    def demote_headings(self, html_content):
+        """Знижує рівень заголовків на один (h1 → h2 ...), щоб у закладках книги
+        кожен writeup був вкладений у свій роздільник"""
+        return HEADING_TAG_PATTERN.sub(
+            lambda match: f"<{match.group(1)}h{min(6, int(match.group(2)) + 1)}", html_content
+        )
+
+    def build_book_html(self, index_markdown, sections):
+        """Збирає індекс, роздільники та writeup'и в один HTML документ.
+
+        sections - список пар (заголовок роздільника, HTML фрагмент writeup'у).
+        """
+        parts = [
+            self.renderer.html_prefix.replace('</head>', BOOK_CSS_STYLES + '</head>', 1),
+            '<section class="book-index">',
+            self.renderer.render_body(index_markdown),
+            '</section>',
+        ]
+        for title, body_html in sections:
+            parts.append(f'<section class="book-separator"><h1>{html.escape(title)}</h1></section>')
+            parts.append(f'<section class="book-writeup">{body_html}</section>')
+        parts.append(self.renderer.html_suffix)
+        return ''.join(parts)
+
+    def find_book_section_pages(self, pdf_data, section_count):
+        """Знаходить номери сторінок (з 1) роздільників за закладками першого проходу.
+
+        Закладки верхнього рівня: індекс, потім по одній на кожен роздільник.
+        Повертає список номерів або None, якщо структура не збігається.
+        """
+        reader = PdfReader(io.BytesIO(pdf_data))
+        top_level = [entry for entry in reader.outline if not isinstance(entry, list)]
+        if len(top_level) != section_count + 1:
+            return None
+        return [reader.get_destination_page_number(entry) + 1 for entry in top_level[1:]]
+
+    async def render_book(self, challenges, browser=None):
+        """Друкує всю колекцію одним документом у ALL_WRITEUPS_MERGED.pdf.
+
+        Перший прохід визначає сторінки розділів за закладками Chromium,
+        другий друкує книгу з реальними номерами сторінок у змісті.
+        Повертає кількість задач, що увійшли до книги.
+        """
+        merged_path = self.output_dir / "ALL_WRITEUPS_MERGED.pdf"
+
+        # Той самий порядок, що й при об'єднанні окремих PDF
+        ordered = sorted(challenges, key=lambda challenge: self.output_path_for(challenge).name)
+        included = []
+        sections = []
+        for challenge in ordered:
+            try:
+                print(f"Обробляю: {challenge['category']} - {challenge['name']}")
+                markdown_content = self.build_challenge_markdown(challenge)
+                assets_dir = challenge['path'] / 'assets'
+                data_urls = []
+                processed_markdown = self.process_images_in_markdown(markdown_content, assets_dir, data_urls=data_urls)
+                body_html = self.inline_data_urls(
+                    self.demote_headings(self.renderer.render_body(processed_markdown)), data_urls
+                )
+            except Exception as e:
+                print(f"❌ Помилка при обробці {challenge['name']}: {e}")
+                continue
+            included.append(challenge)
+            sections.append((self.separator_title(self.output_path_for(challenge)), body_html))
+
+        if not included:
+            return 0
+
+        pdf_options = {
+            # Книга друкується одним документом: тайм-аут пропорційний кількості задач
+            'timeout': self.page_timeout * len(sections) if self.page_timeout else 0,
+            'outline': True,
+            'tagged': True,
+            'display_header_footer': True,
+            'header_template': '<span></span>',
+            'footer_template': BOOK_FOOTER_TEMPLATE,
+        }
+
+        async with self.browser_session(browser) as browser:
+            section_pages = None
+            if MERGE_AVAILABLE:
+                # Перший прохід: заповнювачі тієї ж ширини, щоб верстка змісту не змінилась
+                placeholders = {(c['category'], c['name']): "0000" for c in included}
+                draft_html = self.build_book_html(self.build_index_markdown(included, placeholders), sections)
+                print("📖 Перший прохід: визначаю сторінки розділів...")
+                draft_pdf = await self.print_with_retries(browser, draft_html, **pdf_options)
+                section_pages = self.find_book_section_pages(draft_pdf, len(sections))
+                if section_pages is None:
+                    print("⚠️  Не вдалося визначити сторінки розділів, зміст буде без номерів")
+
+            if section_pages:
+                page_numbers = {
+                    (challenge['category'], challenge['name']): page_number
+                    for challenge, page_number in zip(included, section_pages)
+                }
+                index_markdown = self.build_index_markdown(included, page_numbers)
+            else:
+                index_markdown = self.build_index_markdown(included)
+
+            print("📖 Друкую книгу...")
+            book_html = self.build_book_html(index_markdown, sections)
+            await self.print_with_retries(browser, book_html, merged_path, **pdf_options)
+
+        print(f"\n🎉 Успішно створено книгу: {merged_path}")
+        if self.optimize_pdf:
+            self.optimize_merged_pdf(merged_path)
+        return len(included)
+
+    def render_site(self, challenges):
+        """Експортує writeup'и як статичний HTML сайт у output_dir/site без браузера.
+
+        Спільні style.css та assets/ (зображення за хешем вмісту), сторінка
+        на кожну задачу та index.html з тим самим групуванням, що й індекс PDF.
+        Повертає кількість створених сторінок.
+        """
+        site_dir = self.output_dir / "site"
+        site_dir.mkdir(exist_ok=True)
+        store = SiteAssetStore(site_dir / "assets")
+
+        stylesheet = CSS_STYLES.replace('<style>', '').replace('</style>', '').strip()
+        (site_dir / "style.css").write_text(stylesheet + "\n" + SITE_CSS_STYLES, encoding='utf-8')
+
+        nav = '<nav class="site-nav"><a href="index.html">← Усі writeup\'и</a></nav>'
+        links = {}
+        pages = set()
+        for challenge in challenges:
+            page_name = self.output_path_for(challenge).with_suffix('.html').name
+            stats = {
+                'challenge': f"{challenge['category']}/{challenge['name']}",
+                'output': page_name,
+                'timings': {},
+                'bytes': {'image': 0},
+            }
+            self.stats.append(stats)
+            timings = stats['timings']
+            try:
+                print(f"Обробляю: {challenge['category']} - {challenge['name']}")
+                with stage_timer(timings, 'read'):
+                    markdown_content = self.build_challenge_markdown(challenge)
+                assets_dir = challenge['path'] / 'assets'
+                with stage_timer(timings, 'images'):
+                    processed_markdown = self.process_images_in_markdown(
+                        markdown_content, assets_dir, stats, publish=store.publish
+                    )
+                with stage_timer(timings, 'markdown'):
+                    body_html = self.renderer.render_body(processed_markdown)
+                page_html = SITE_PAGE_TEMPLATE.format(
+                    title=html.escape(f"{challenge['name']} - {challenge['category']}"), nav=nav, body=body_html
+                )
+                (site_dir / page_name).write_text(page_html, encoding='utf-8')
+            except Exception as e:
+                stats['error'] = str(e)
+                print(f"❌ Помилка при обробці {challenge['name']}: {e}")
+                continue
+            links[(challenge['category'], challenge['name'])] = urllib.parse.quote(page_name)
+            pages.add(page_name)
+
+        included = [c for c in challenges if (c['category'], c['name']) in links]
+        index_body = self.renderer.render_body(self.build_index_markdown(included, links=links))
+        (site_dir / "index.html").write_text(SITE_PAGE_TEMPLATE.format(
+            title="CTF Writeups Collection", nav=SITE_FILTER_SCRIPT,
+            body=f'<div class="site-index">{index_body}</div>'
+        ), encoding='utf-8')
+
+        # Прибираємо сторінки видалених задач і зображення, на які ніхто не посилається
+        for path in site_dir.glob("*.html"):
+            if path.name != "index.html" and path.name not in pages:
+                path.unlink()
+        store.remove_unused()
+
+        print(f"\n🌐 Статичний сайт: {site_dir / 'index.html'} "
+              f"({len(pages)} сторінок, {len(store.published)} унікальних зображень)")
+        return len(pages)
+
+    def print_stats_summary(self, top=5):
+        """Виводить сумарний час етапів і найповільніші writeup'и"""
+        if not self.stats:
+            return
+
+        for entry in self.stats:
+            if entry['output'] in self.merge_timings:
+                entry['timings']['merge'] = self.merge_timings[entry['output']]
+
+        totals = {}
+        for entry in self.stats:
+            for stage, seconds in entry['timings'].items():
+                totals[stage] = totals.get(stage, 0) + seconds
+
+        print("\n⏱️  Час етапів (сумарно по всіх задачах):")
+        for stage in STATS_STAGES:
+            if stage in totals:
+                print(f"  {stage:<9} {totals[stage]:8.2f} с")
+
+        slowest = sorted(self.stats, key=lambda entry: sum(entry['timings'].values()), reverse=True)[:top]
+        print(f"\n🐢 Найповільніші writeup'и (топ {len(slowest)}):")
+        for entry in slowest:
+            timings = entry['timings']
+            total = sum(timings.values())
+            dominant = max(timings, key=timings.get) if timings else '-'
+            image_mb = entry['bytes'].get('image', 0) / (1024 * 1024)
+            pdf_mb = entry['bytes'].get('pdf', 0) / (1024 * 1024)
+            print(f"  {total:6.2f} с  {entry['challenge']}  "
+                  f"(найдовше: {dominant} {timings.get(dominant, 0):.2f} с, "
+                  f"зображення {image_mb:.1f} MB, PDF {pdf_mb:.1f} MB)")
+
+    def report_failures(self):
+        """Виводить задачі, які не вдалося зібрати, і записує їх у failures.json"""
+        report_path = self.output_dir / FAILURE_REPORT_NAME
+        failures = [
+            {'challenge': entry['challenge'], 'error': entry['error'], 'attempts': entry.get('attempts', 1)}
+            for entry in self.stats if 'error' in entry
+        ]
+        if not failures:
+            report_path.unlink(missing_ok=True)
+            return
+
+        print(f"\n❗ Не вдалося зібрати {len(failures)} задач:")
+        for failure in failures:
+            print(f"  - {failure['challenge']} (спроб: {failure['attempts']}): {failure['error']}")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(failures, f, indent=1, ensure_ascii=False)
+        print(f"📝 Звіт про помилки: {report_path}")
+
+    def save_stats(self, stats_path):
+        """Записує статистику по задачах у JSON"""
+        with open(stats_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, indent=1, ensure_ascii=False)
+        print(f"📊 Статистику збережено: {stats_path}")
+
+    async def run_blocking(self, func, *args):
+        """Синхронний етап run() (обхід дерева, хешування, об'єднання): у потоці, якщо
+        blocking_in_thread, щоб не зупиняти інші задачі та браузери сервера, інакше тут же"""
+        if self.blocking_in_thread:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def plan_builds(self, challenges, manifest, git_state=None):
+        """Рахує ключі збірки задач: (новий маніфест, PDF з кешу або None по позиціях, позиції для рендеру).
+
+        У режиму --git-changes незачеплені задачі не хешуються: ключ береться з маніфесту.
+        """
+        unchanged = self.git_unchanged_challenges(challenges, git_state) if git_state and self.use_cache else set()
+        new_manifest = {}
+        results = [None] * len(challenges)
+        pending = []
+        for position, challenge in enumerate(challenges):
+            output_path = self.output_path_for(challenge)
+            if output_path.name in unchanged and output_path.name in manifest and output_path.exists():
+                new_manifest[output_path.name] = manifest[output_path.name]
+                results[position] = output_path
+                continue
+            key = self.compute_build_key(challenge)
+            new_manifest[output_path.name] = key
+            if self.is_cached(manifest, output_path, key):
+                results[position] = output_path
+            else:
+                pending.append(position)
+        return new_manifest, results, pending
+
+    async def run(self, browser=None):
+        """Основна функція запуску (browser - вже запущений Chromium для режиму --watch)"""
         print("🚀 Починаю конвертацію CTF writeups...")
+        self.asset_indexes = {}
+        self.generated_pdfs = []
+        self.stats = []
+        self.merge_timings = {}
 
         # Знаходимо всі задачі
-        challenges = self.find_challenge_folders()
+        challenges = await self.run_blocking(self.find_challenge_folders)
 
         if not challenges:
             print("❌ Не знайдено жодної задачі з README.md")
@@ -527,38 +3165,618 @@ class CTFWriteupConverter:
 
         print(f"\n📄 Результати будуть збережені в: {self.output_dir.absolute()}")
 
-        # Запускаємо браузер
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
+        if self.engine == 'book':
+            success_count = await self.render_book(challenges, browser)
+            print(f"\n✅ Завершено! До книги увійшло: {success_count}/{len(challenges)} задач")
+            print(f"\n📁 Всі файли збережено в: {self.output_dir.absolute()}")
+            return
 
-            # Створюємо індекс
-            await self.create_index_pdf(challenges, browser)
+        if self.engine == 'html':
+            success_count = await self.run_blocking(self.render_site, challenges)
+            print(f"\n✅ Завершено! Сторінок сайту: {success_count}/{len(challenges)}")
+            self.print_stats_summary()
+            if self.stats_path:
+                self.save_stats(self.stats_path)
+            self.report_failures()
+            return
+
+        if self.jobs > 1:
+            print(f"⚡ Паралельний рендеринг: {self.jobs} сторінок одночасно")
+
+        # Визначаємо, які PDF можна взяти з кешу збірки
+        manifest = self.load_build_manifest()
+        journal = self.load_build_journal()
+        if journal and self.use_cache:
+            print(f"⏯️  Продовжую перерваний запуск (у журналі {len(journal)} готових задач)")
+            manifest.update(journal)
+        git_state = await self.run_blocking(self.git_build_state) if self.git_changes else None
+        if self.git_changes and git_state is None:
+            print("⚠️  Репозиторій не є git checkout'ом, --git-changes не застосовується")
+        new_manifest, results, pending = await self.run_blocking(
+            self.plan_builds, challenges, manifest, git_state
+        )
+
+        index_path = self.output_dir / "_INDEX.pdf"
+        index_key = self.compute_text_key(self.build_index_markdown(challenges))
+        new_manifest[index_path.name] = index_key
+        index_cached = self.is_cached(manifest, index_path, index_key)
+
+        cached_count = len(challenges) - len(pending)
+        if cached_count:
+            print(f"♻️  Без змін (взято з кешу): {cached_count} задач")
+
+        pending_challenges = [challenges[position] for position in pending]
+        index_challenges = None if index_cached else challenges
+
+        # Кожна готова задача одразу пишеться в журнал, щоб перерваний запуск можна було продовжити
+        self.open_journal()
+        try:
+            if not pending_challenges and index_cached:
+                rendered_index, rendered = None, []
+            elif self.shards > 1 and len(pending_challenges) > 1 and browser is None:
+                print(f"🧩 Розбиваю задачі на {self.shards} процесів")
+                rendered_index, rendered = await self.render_sharded(pending_challenges, index_challenges)
+            else:
+                rendered_index, rendered = await self.render_challenges(
+                    pending_challenges, index_challenges, browser
+                )
+        finally:
+            self.close_journal()
 
-            # Конвертуємо кожну задачу
-            success_count = 0
-            for challenge in challenges:
-                if await self.convert_to_pdf(challenge, browser):
-                    success_count += 1
+        for position, output_path in zip(pending, rendered):
+            results[position] = output_path
 
-            await browser.close()
+        if not index_cached:
+            index_path = rendered_index
+
+        if index_path:
+            self.generated_pdfs.append(index_path)  # Додаємо індекс до списку
+        else:
+            new_manifest.pop("_INDEX.pdf", None)
+
+        # Додаємо результати у порядку задач, а не в порядку завершення
+        success_count = 0
+        for challenge, output_path in zip(challenges, results):
+            if output_path:
+                self.generated_pdfs.append(output_path)
+                success_count += 1
+            else:
+                # Невдалі задачі не кешуємо, щоб наступний запуск спробував ще раз
+                new_manifest.pop(self.output_path_for(challenge).name, None)
 
         print(f"\n✅ Завершено конвертацію! Успішно створено: {success_count}/{len(challenges)} задач")
 
-        # Об'єднуємо PDF файли
+        # Об'єднуємо PDF файли (якщо жоден з них не змінився, об'єднаний файл актуальний)
+        self.pdf_challenges = {self.output_path_for(challenge).name: challenge for challenge in challenges}
+        merged_path = self.merged_output_path()
+        merged_key = self.compute_merged_key(new_manifest)
         if self.generated_pdfs:
-            self.merge_pdfs()
+            if self.is_cached(manifest, merged_path, merged_key):
+                print("♻️  Об'єднаний PDF актуальний, пропускаю об'єднання")
+                new_manifest[merged_path.name] = merged_key
+            elif await self.run_blocking(self.merge_pdfs):
+                new_manifest[merged_path.name] = merged_key
+
+        self.save_build_manifest(new_manifest)
+        self.close_journal(remove=True)
+        if git_state:
+            self.save_git_build_state(git_state)
+
+        self.print_stats_summary()
+        self.report_failures()
+        if self.stats_path:
+            self.save_stats(self.stats_path)
 
         print(f"\n📁 Всі файли збережено в: {self.output_dir.absolute()}")
         print(f"📋 Індивідуальні PDF: {len(self.generated_pdfs)} файлів")
-        merged_file = self.output_dir / "ALL_WRITEUPS_MERGED.pdf"
-        if merged_file.exists():
+        merged_file = self.merged_output_path()
+        if self.split_by and merged_file.exists():
+            print(f"📚 Томи: {merged_file.name}/ ({len(list(merged_file.glob('*.pdf')))} файлів)")
+        elif merged_file.exists():
             print(f"🔗 Об'єднаний PDF: {merged_file.name}")
 
+    def affected_challenges(self, challenges, changed_paths):
+        """Задачі, в папках яких є змінені файли"""
+        affected = []
+        for challenge in challenges:
+            challenge_dir = challenge['path'].resolve()
+            if any(path == challenge_dir or challenge_dir in path.parents for path in changed_paths):
+                affected.append(challenge)
+        return affected
+
+    async def rebuild_changed(self, browser, challenges, changed_paths):
+        """Перезбирає лише задачі, яких стосуються зміни, та оновлює індекс і об'єднаний PDF.
+
+        Повертає актуальний список задач.
+        """
+        new_challenges = self.find_challenge_folders()
+        self.asset_indexes.clear()  # Зображення могли з'явитись або зникнути
+        old_names = {self.output_path_for(challenge).name for challenge in challenges}
+        new_names = {self.output_path_for(challenge).name for challenge in new_challenges}
+
+        affected = self.affected_challenges(new_challenges, changed_paths)
+        affected += [
+            challenge for challenge in new_challenges
+            if self.output_path_for(challenge).name not in old_names and challenge not in affected
+        ]
+        set_changed = old_names != new_names
+
+        if not affected and not set_changed:
+            return new_challenges
+
+        started = time.perf_counter()
+        for challenge in affected:
+            print(f"✏️  Змінено: {challenge['category']}/{challenge['name']}")
+
+        if self.engine == 'book':
+            await self.render_book(new_challenges, browser)
+            print(f"⏱️  Оновлено за {time.perf_counter() - started:.1f} с")
+            return new_challenges
+
+        if self.engine == 'html':
+            self.render_site(new_challenges)
+            print(f"⏱️  Оновлено за {time.perf_counter() - started:.1f} с")
+            return new_challenges
+
+        manifest = self.load_build_manifest()
+
+        # Видаляємо PDF задач, яких більше немає
+        for name in old_names - new_names:
+            stale_path = self.output_dir / name
+            if stale_path.exists():
+                stale_path.unlink()
+            manifest.pop(name, None)
+
+        keys = {self.output_path_for(challenge).name: self.compute_build_key(challenge) for challenge in affected}
+        results = await self.convert_many(affected, browser)
+        for challenge, output_path in zip(affected, results):
+            name = self.output_path_for(challenge).name
+            if output_path:
+                manifest[name] = keys[name]
+            else:
+                manifest.pop(name, None)
+
+        index_path = self.output_dir / "_INDEX.pdf"
+        if set_changed or not index_path.exists():
+            index_path = await self.create_index_pdf(new_challenges, browser)
+            manifest[index_path.name] = self.compute_text_key(self.build_index_markdown(new_challenges))
+
+        self.generated_pdfs = [index_path] + [
+            self.output_path_for(challenge) for challenge in new_challenges
+            if self.output_path_for(challenge).exists()
+        ]
+        self.pdf_challenges = {self.output_path_for(challenge).name: challenge for challenge in new_challenges}
+        merged_path = self.merged_output_path()
+        if self.merge_pdfs():
+            manifest[merged_path.name] = self.compute_merged_key(manifest)
+        self.save_build_manifest(manifest)
+
+        print(f"⏱️  Оновлено за {time.perf_counter() - started:.1f} с")
+        return new_challenges
+
+    async def watch(self, debounce=0.3):
+        """Режим --watch: повна збірка, потім перезбірка змінених задач при кожному збереженні.
+
+        Chromium залишається запущеним між перезбірками.
+        """
+        async with self.browser_session() as browser:
+            await self.run(browser)
+            challenges = self.find_challenge_folders()
+
+            watcher = TreeWatcher(self.repo_path, ignore=[self.output_dir], debounce=debounce)
+            await watcher.start()
+            print(f"\n👀 Стежу за змінами в {self.repo_path} ({watcher.backend}). Ctrl+C для виходу")
+            try:
+                while True:
+                    changed_paths = await watcher.wait_for_changes()
+                    try:
+                        challenges = await self.rebuild_changed(browser, challenges, changed_paths)
+                    except Exception as e:
+                        print(f"❌ Помилка перезбірки: {e}")
+            finally:
+                watcher.stop()
+
+
+class TreeWatcher:
+    """Стежить за змінами файлів у дереві: через watchdog (inotify/FSEvents),
+    якщо він встановлений, інакше періодично опитує mtime файлів.
+
+    wait_for_changes() чекає першої зміни, потім збирає всі зміни,
+    доки не настане пауза debounce секунд, і повертає множину шляхів.
+    """
+
+    def __init__(self, root, ignore=(), debounce=0.3, poll_interval=0.5):
+        self.root = Path(root).resolve()
+        self.ignore = [Path(path).resolve() for path in ignore]
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = 'inotify' if WATCHDOG_AVAILABLE else 'polling'
+        self._queue = None
+        self._observer = None
+        self._poll_task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        if WATCHDOG_AVAILABLE:
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    for path in (event.src_path, getattr(event, 'dest_path', None)):
+                        if path:
+                            loop.call_soon_threadsafe(watcher._put, path)
+
+            self._observer = Observer()
+            self._observer.schedule(Handler(), str(self.root), recursive=True)
+            self._observer.start()
+        else:
+            self._poll_task = asyncio.create_task(self._poll())
+
+    def stop(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+        if self._poll_task:
+            self._poll_task.cancel()
+
+    async def wait_for_changes(self):
+        changed = {await self._queue.get()}
+        while True:
+            try:
+                changed.add(await asyncio.wait_for(self._queue.get(), self.debounce))
+            except asyncio.TimeoutError:
+                return changed
+
+    def _put(self, path):
+        absolute = Path(os.path.abspath(path))
+        path = absolute.resolve()
+        if self.root != path and self.root not in path.parents:
+            # Симлінк на файл поза деревом (спільне зображення): залишаємо шлях усередині дерева
+            path = absolute
+            if self.root not in path.parents:
+                return
+        if any(path == ignored or ignored in path.parents for ignored in self.ignore):
+            return
+        if any(part.startswith('.') for part in path.relative_to(self.root).parts):
+            return  # .git, файли редакторів тощо
+        self._queue.put_nowait(path)
+
+    def _snapshot(self):
+        """mtime всіх файлів і папок дерева (для режиму опитування)"""
+        snapshot = {}
+        stack = [str(self.root)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        try:
+                            snapshot[entry.path] = entry.stat().st_mtime_ns
+                        except OSError:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+        return snapshot
+
+    async def _poll(self):
+        previous = await asyncio.to_thread(self._snapshot)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await asyncio.to_thread(self._snapshot)
+            for path in previous.keys() | current.keys():
+                if previous.get(path) != current.get(path):
+                    self._put(path)
+            previous = current
+
+
+class BrowserPool:
+    """Пул теплих браузерів Chromium для режиму сервера.
+
+    Браузер видається одній задачі за раз; якщо він впав, замість нього
+    запускається новий.
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self._playwright = None
+        self._queue = None
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        self._queue = asyncio.Queue()
+        for _ in range(self.size):
+            self._queue.put_nowait(await self._playwright.chromium.launch())
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        browser = await self._queue.get()
+        try:
+            yield browser
+        finally:
+            if not browser.is_connected():
+                print("⚠️  Браузер впав, запускаю новий")
+                browser = await self._playwright.chromium.launch()
+            self._queue.put_nowait(browser)
+
+    async def close(self):
+        while not self._queue.empty():
+            await self._queue.get_nowait().close()
+        await self._playwright.stop()
+
+
+async def send_message(writer, header, payload=None):
+    """Надсилає повідомлення протоколу сервера: JSON рядок, за яким
+    (якщо в заголовку є size) йде рівно size байтів даних"""
+    if payload is not None:
+        header = dict(header, size=len(payload))
+    writer.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b"\n")
+    if payload is not None:
+        writer.write(payload)
+    await writer.drain()
+
+
+async def read_message(reader):
+    """Читає одне повідомлення протоколу сервера, повертає (заголовок, дані або None)"""
+    line = await reader.readline()
+    if not line:
+        return None, None
+    header = json.loads(line)
+    payload = None
+    if 'size' in header:
+        payload = await reader.readexactly(header['size'])
+    return header, payload
+
+
+class ConversionServer:
+    """Довготривалий сервер конвертації з пулом теплих браузерів.
+
+    Слухає Unix сокет або localhost TCP порт. Кожне з'єднання - одна задача:
+    клієнт надсилає JSON рядок, сервер відповідає потоком повідомлень
+    (див. send_message) і закриває з'єднання. Типи задач:
+
+    - {"type": "repo", "repo_path", "output_dir", "options"} - повна збірка репозиторію
+    - {"type": "challenges", "repo_path", "output_dir", "challenges": ["web/Name", ...], "options"}
+    - {"type": "markdown", "markdown", "base_dir"} - один документ, PDF повертається байтами
+
+    Для repo/challenges кожна готова задача надсилається подією "result"
+    (з байтами PDF, якщо "include_pdf": true), в кінці - подія "done".
+    """
+
+    # Опції конвертера, які клієнт може передати у задачі
+    ALLOWED_OPTIONS = {
+        'jobs', 'use_cache', 'image_dpi', 'image_format', 'image_quality', 'asset_mode',
+        'merge_mode', 'engine', 'max_depth', 'include', 'exclude', 'categories', 'discovery_cache',
+        'optimize_pdf', 'backend', 'page_timeout', 'retries', 'git_changes', 'prepare_workers',
+        'split_by', 'volume_limit', 'highlight_limit_kb',
+    }
+
+    def __init__(self, socket_path=None, port=None, browsers=2):
+        self.socket_path = socket_path
+        self.port = port
+        self.pool = BrowserPool(browsers)
+        # Спільні між задачами рендерери (рендер захищений блокуванням), по одному на ліміт підсвічування
+        self.renderers = {}
+        # Вихідні папки задач, що виконуються: дві задачі в одну папку переписали б
+        # одна одній маніфест, журнал і об'єднаний PDF
+        self.busy_output_dirs = set()
+        self.work_dir = Path(tempfile.mkdtemp(prefix="ctf_server_"))
+
+    async def serve_forever(self):
+        await self.pool.start()
+        if self.port:
+            server = await asyncio.start_server(
+                self.handle_connection, '127.0.0.1', self.port, limit=MESSAGE_LINE_LIMIT
+            )
+            address = f"127.0.0.1:{self.port}"
+        else:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            server = await asyncio.start_unix_server(
+                self.handle_connection, self.socket_path, limit=MESSAGE_LINE_LIMIT
+            )
+            address = self.socket_path
+
+        print(f"🛰️  Сервер конвертації слухає {address} (теплих браузерів: {self.pool.size}). Ctrl+C для виходу")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.pool.close()
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            if self.socket_path and not self.port and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
 
-def check_dependencies():
+    async def handle_connection(self, reader, writer):
+        try:
+            header, payload = await read_message(reader)
+            if header is None:
+                return
+            # markdown передається даними після заголовка, а не в JSON рядку
+            if header.get('type') == 'markdown' and payload is not None:
+                header['markdown'] = payload.decode('utf-8')
+            handlers = {
+                'repo': self.handle_repo,
+                'challenges': self.handle_challenges,
+                'markdown': self.handle_markdown,
+            }
+            handler = handlers.get(header.get('type'))
+            if handler is None:
+                raise ValueError(f"невідомий тип задачі: {header.get('type')}")
+            await handler(header, writer)
+        except Exception as e:
+            print(f"❌ Помилка задачі сервера: {e}")
+            try:
+                await send_message(writer, {'event': 'error', 'message': str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    def renderer_for(self, highlight_limit_kb=DEFAULT_HIGHLIGHT_LIMIT_KB):
+        """Спільний рендерер з потрібним лімітом підсвічування (ліміт входить і в ключ збірки)"""
+        if highlight_limit_kb not in self.renderers:
+            self.renderers[highlight_limit_kb] = MarkdownRenderer(highlight_limit_kb=highlight_limit_kb)
+        return self.renderers[highlight_limit_kb]
+
+    def make_converter(self, request):
+        options = request.get('options') or {}
+        unknown = set(options) - self.ALLOWED_OPTIONS
+        if unknown:
+            raise ValueError(f"невідомі опції: {', '.join(sorted(unknown))}")
+        repo_path = request['repo_path']
+        if not os.path.exists(repo_path):
+            raise ValueError(f"шлях не існує: {repo_path}")
+        # Шардинг у сервері не використовується: браузери вже в пулі
+        renderer = self.renderer_for(options.get('highlight_limit_kb', DEFAULT_HIGHLIGHT_LIMIT_KB))
+        converter = CTFWriteupConverter(repo_path, request['output_dir'], renderer=renderer, **options)
+        converter.blocking_in_thread = True
+        return converter
+
+    @contextlib.contextmanager
+    def claim_output_dir(self, converter):
+        """Займає вихідну папку задачі; друга задача в ту саму папку відхиляється"""
+        output_dir = converter.output_dir.resolve()
+        if output_dir in self.busy_output_dirs:
+            raise ValueError(f"вихідна папка вже використовується іншою задачею: {output_dir}")
+        self.busy_output_dirs.add(output_dir)
+        try:
+            yield
+        finally:
+            self.busy_output_dirs.discard(output_dir)
+
+    async def _stream_results(self, converter, request, writer):
+        include_pdf = request.get('include_pdf', False)
+
+        async def on_result(challenge, output_path):
+            event = {
+                'event': 'result',
+                'challenge': f"{challenge['category']}/{challenge['name']}",
+                'ok': output_path is not None,
+                'path': str(output_path) if output_path else None,
+            }
+            payload = output_path.read_bytes() if include_pdf and output_path else None
+            await send_message(writer, event, payload)
+
+        converter.on_result = on_result
+
+    async def handle_repo(self, request, writer):
+        converter = self.make_converter(request)
+        await self._stream_results(converter, request, writer)
+        with self.claim_output_dir(converter):
+            async with self.pool.acquire() as browser:
+                await converter.run(browser)
+
+        merged_path = converter.output_dir / "ALL_WRITEUPS_MERGED.pdf"
+        volumes_dir = converter.output_dir / VOLUMES_DIR_NAME
+        await send_message(writer, {
+            'event': 'done',
+            'pdfs': [str(path) for path in converter.generated_pdfs],
+            'merged': str(merged_path) if merged_path.exists() else None,
+            'volumes': [str(path) for path in sorted(volumes_dir.glob("*.pdf"))] if converter.split_by else [],
+        })
+
+    async def handle_challenges(self, request, writer):
+        converter = self.make_converter(request)
+        wanted = set(request.get('challenges') or [])
+        challenges = [
+            challenge for challenge in await asyncio.to_thread(converter.find_challenge_folders)
+            if f"{challenge['category']}/{challenge['name']}" in wanted
+        ]
+        missing = wanted - {f"{challenge['category']}/{challenge['name']}" for challenge in challenges}
+
+        await self._stream_results(converter, request, writer)
+        with self.claim_output_dir(converter):
+            async with self.pool.acquire() as browser:
+                results = await converter.convert_many(challenges, browser)
+
+        await send_message(writer, {
+            'event': 'done',
+            'pdfs': [str(path) for path in results if path],
+            'missing': sorted(missing),
+        })
+
+    async def handle_markdown(self, request, writer):
+        base_dir = Path(request.get('base_dir') or self.work_dir)
+        converter = CTFWriteupConverter(base_dir, self.work_dir, renderer=self.renderer_for(),
+                                        discovery_cache=False, prepare_workers=0)
+
+        async with self.pool.acquire() as browser:
+            async with contextlib.aclosing(converter.stream([request['markdown']], browser, write_files=False)) as results:
+                async for result in results:
+                    if not result['ok']:
+                        raise RuntimeError(result['error'])
+                    await send_message(writer, {'event': 'pdf', 'pages': result['pages']}, result['pdf'])
+
+
+async def request_conversion(request, socket_path=None, port=None):
+    """Клієнт сервера: надсилає задачу і повертає асинхронний генератор
+    повідомлень (заголовок, дані)"""
+    if port:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=MESSAGE_LINE_LIMIT)
+    else:
+        reader, writer = await asyncio.open_unix_connection(socket_path, limit=MESSAGE_LINE_LIMIT)
+
+    # Документ markdown може бути великим: він іде даними після заголовка
+    payload = None
+    if 'markdown' in request:
+        request = dict(request)
+        payload = request.pop('markdown').encode('utf-8')
+
+    try:
+        await send_message(writer, request, payload)
+        while True:
+            header, payload = await read_message(reader)
+            if header is None:
+                return
+            yield header, payload
+    finally:
+        writer.close()
+
+
+def _render_shard(repo_path, output_dir, challenges, index_challenges, options):
+    """Точка входу процесу-шарда: рендерить свою частину задач власним браузером"""
+    converter = CTFWriteupConverter(repo_path, output_dir, **options)
+    converter.open_journal()
+    try:
+        index_path, results = asyncio.run(converter.render_challenges(challenges, index_challenges=index_challenges))
+    finally:
+        converter.close_journal()
+    return index_path, results, converter.stats
+
+
+def _build_volume(output_dir, volume_path, pdf_paths, challenges, optimize, index_pdf=None):
+    """Точка входу процесу тому: пише один том об'єднаного PDF"""
+    converter = CTFWriteupConverter(output_dir, output_dir, image_dpi=0, discovery_cache=False, prepare_workers=0)
+    page_count = converter.build_volume(
+        volume_path, [Path(pdf_path) for pdf_path in pdf_paths], challenges, optimize, index_pdf
+    )
+    return page_count, converter.merge_timings
+
+
+# Конвертер процесу підготовки HTML (див. CTFWriteupConverter.preparation_pool)
+_prepare_converter = None
+
+
+def _init_prepare_worker(repo_path, output_dir, options):
+    """Ініціалізатор процесу підготовки: один конвертер (і рендерер) на процес"""
+    global _prepare_converter
+    _prepare_converter = CTFWriteupConverter(repo_path, output_dir, discovery_cache=False, **options)
+
+
+def _prepare_in_worker(challenge, with_key):
+    """prepare_challenge у процесі пулу"""
+    return _prepare_converter.prepare_challenge(challenge, with_key)
+
+
+def check_dependencies(backend='chromium', engine='pdfs', split_by=None):
     """Перевіряє наявність необхідних бібліотек"""
     dependencies = [
-        ('playwright', 'playwright'),
         ('markdown', 'markdown'),
         ('PIL', 'Pillow')
     ]
@@ -568,6 +3786,20 @@ def check_dependencies():
         ('reportlab', 'reportlab')
     ]
 
+    # Статичному сайту не потрібні ні Chromium, ні бібліотеки для PDF
+    if engine == 'html':
+        optional_dependencies = []
+    # Бекенду reportlab не потрібен Chromium, зате reportlab стає обов'язковим
+    elif backend == 'reportlab':
+        dependencies += optional_dependencies
+        optional_dependencies = []
+    else:
+        dependencies.insert(0, ('playwright', 'playwright'))
+        # Томи (--split-by) збираються PyPDF2, а індекс тому верстається reportlab навіть з Chromium
+        if split_by:
+            dependencies += optional_dependencies
+            optional_dependencies = []
+
     missing_packages = []
     missing_optional = []
 
@@ -603,21 +3835,218 @@ def check_dependencies():
     return True
 
 
+def print_tracemalloc_report(limit=10):
+    """Виводить пікову пам'ять Python і місця з найбільшими виділеннями"""
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    print(f"\n🧠 Пікова пам'ять Python (tracemalloc): {peak / (1024 * 1024):.1f} MB")
+    print(f"Найбільші виділення (топ {limit}):")
+    for stat in snapshot.statistics('lineno')[:limit]:
+        print(f"  {stat}")
+
+
+def parse_args(argv=None):
+    """Розбирає аргументи командного рядка"""
+    parser = argparse.ArgumentParser(
+        description="Конвертує CTF writeup'и (README.md) в PDF та об'єднує їх в один файл",
+        epilog=(
+            "Приклади:\n"
+            "  python3 main.py /Users/username/cyber-apocalypse-2025/forensics/ writeups_1\n"
+            "  python3 main.py /Users/username/business-ctf-2025/forensics my_writeups --jobs 8"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('repo_path', nargs='?', help="шлях до репозиторію або категорії")
+    parser.add_argument('output_dir', nargs='?', help="папка для PDF")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="скільки writeup'ів рендерити одночасно (за замовчуванням 1)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="ігнорувати кеш збірки та перерендерити всі writeup'и")
+    parser.add_argument('--image-dpi', type=int, default=150,
+                        help="роздільність зображень під ширину сторінки A4 (0 - не змінювати зображення)")
+    parser.add_argument('--image-format', choices=['auto', 'jpeg', 'webp', 'png'], default='auto',
+                        help="формат перестиснутих зображень (auto: JPEG для фото, PNG для скріншотів)")
+    parser.add_argument('--image-quality', type=int, default=85,
+                        help="якість JPEG/WebP (1-95, за замовчуванням 85)")
+    parser.add_argument('--assets', choices=['inline', 'file'], default='inline',
+                        help="як передавати зображення в Chromium: inline (base64 в HTML) "
+                             "або file (посилання на файли з папки задачі)")
+    parser.add_argument('--merge-mode', choices=['memory', 'stream'], default='memory',
+                        help="memory: об'єднання через PdfWriter у пам'яті; "
+                             "stream: потоковий запис з обмеженим використанням пам'яті")
+    parser.add_argument('--backend', choices=['chromium', 'reportlab'], default='chromium',
+                        help="chromium: друк через Playwright; reportlab: швидкі чернетки без браузера "
+                             "(простіша верстка, без підсвітки синтаксису)")
+    parser.add_argument('--highlight-limit', type=int, default=DEFAULT_HIGHLIGHT_LIMIT_KB, metavar='KB',
+                        help=f"не підсвічувати блоки коду, більші за KB кілобайт "
+                             f"(за замовчуванням {DEFAULT_HIGHLIGHT_LIMIT_KB}, 0 - вимкнути підсвічування)")
+    parser.add_argument('--page-timeout', type=float, default=120, metavar='SEC',
+                        help="тайм-аут завантаження і друку однієї сторінки в секундах (0 - без обмеження)")
+    parser.add_argument('--retries', type=int, default=2,
+                        help="скільки разів повторити задачу після помилки, тайм-ауту чи падіння браузера")
+    parser.add_argument('--optimize-pdf', action='store_true',
+                        help="після об'єднання прибрати дублікати зображень і шрифтів та стиснути потоки")
+    parser.add_argument('--split-by', choices=['category', 'pages', 'size'], default=None,
+                        help="замість одного об'єднаного PDF - томи в папці volumes/: по категоріях "
+                             "або по бюджету сторінок/мегабайт (--volume-limit); томи пишуться паралельно")
+    parser.add_argument('--volume-limit', type=float, default=None, metavar='N',
+                        help="максимум сторінок (--split-by pages) або МБ (--split-by size) на том")
+    parser.add_argument('--engine', choices=['pdfs', 'book', 'html'], default='pdfs',
+                        help="pdfs: окремий PDF на кожен writeup + об'єднання; "
+                             "book: уся колекція друкується одним документом з закладками та змістом; "
+                             "html: статичний сайт у папці site/ зі спільними стилями та зображеннями")
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help="максимальна глибина пошуку задач (за замовчуванням 2 для репозиторію, "
+                             "1 для папки категорії)")
+    parser.add_argument('--include', action='append', default=[], metavar='GLOB',
+                        help="брати лише задачі, шлях яких (відносно репозиторію) підходить під шаблон; "
+                             "можна вказати кілька разів")
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                        help="пропускати папки, шлях яких підходить під шаблон; можна вказати кілька разів")
+    parser.add_argument('--category', action='append', dest='categories', metavar='NAME',
+                        help="брати лише вказані категорії; можна вказати кілька разів")
+    parser.add_argument('--no-discovery-cache', action='store_true',
+                        help="не використовувати кеш дерева папок при пошуку задач")
+    parser.add_argument('--git-changes', action='store_true',
+                        help="перевіряти лише задачі, змінені в git з останньої збірки (замість хешування всіх файлів)")
+    parser.add_argument('--watch', action='store_true',
+                        help="після збірки стежити за змінами та перезбирати лише змінені writeup'и")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="записати час етапів і розміри для кожної задачі у JSON файл")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="профілювати запуск через cProfile і записати результат у файл (.prof)")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="відстежувати виділення пам'яті Python і вивести найбільші місця")
+    parser.add_argument('--prepare-workers', type=int, default=1, metavar='N',
+                        help="підготовка HTML паралельно з друком: 0 - вимкнути, 1 - фоновий потік "
+                             "(за замовчуванням), N - N процесів")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="кількість процесів, кожен з власним Chromium (за замовчуванням 1)")
+    parser.add_argument('--serve', action='store_true',
+                        help="запустити сервер конвертації з пулом теплих браузерів (шляхи не потрібні)")
+    parser.add_argument('--connect', action='store_true',
+                        help="передати збірку запущеному серверу замість локального Chromium")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH,
+                        help=f"Unix сокет сервера (за замовчуванням {DEFAULT_SOCKET_PATH})")
+    parser.add_argument('--port', type=int, default=None,
+                        help="використовувати localhost TCP порт замість Unix сокета")
+    parser.add_argument('--browsers', type=int, default=2,
+                        help="кількість теплих браузерів у сервері (за замовчуванням 2)")
+    args = parser.parse_args(argv)
+
+    if not args.serve and (not args.repo_path or not args.output_dir):
+        parser.error("потрібно вказати <шлях_до_репозиторію> та <папку_для_PDF>")
+    if args.browsers < 1:
+        parser.error("--browsers має бути не менше 1")
+
+    if args.jobs < 1:
+        parser.error("--jobs має бути не менше 1")
+    if args.image_dpi < 0:
+        parser.error("--image-dpi не може бути від'ємним")
+    if not 1 <= args.image_quality <= 95:
+        parser.error("--image-quality має бути в межах 1-95")
+    if args.max_depth is not None and args.max_depth < 1:
+        parser.error("--max-depth має бути не менше 1")
+    if args.shards < 1:
+        parser.error("--shards має бути не менше 1")
+    if args.prepare_workers < 0:
+        parser.error("--prepare-workers не може бути від'ємним")
+    if args.page_timeout < 0:
+        parser.error("--page-timeout не може бути від'ємним")
+    if args.retries < 0:
+        parser.error("--retries не може бути від'ємним")
+    if args.highlight_limit < 0:
+        parser.error("--highlight-limit не може бути від'ємним")
+    if args.split_by in ('pages', 'size') and (args.volume_limit is None or args.volume_limit <= 0):
+        parser.error(f"--split-by {args.split_by} потребує додатного --volume-limit")
+    if args.split_by and args.engine != 'pdfs':
+        parser.error("--split-by працює лише з --engine pdfs")
+    if args.backend == 'reportlab' and args.engine == 'book':
+        parser.error("--engine book потребує Chromium (--backend chromium)")
+
+    return args
+
+
+def converter_options(args):
+    """Параметри CTFWriteupConverter з аргументів командного рядка"""
+    return {
+        'jobs': args.jobs,
+        'use_cache': not args.no_cache,
+        'image_dpi': args.image_dpi,
+        'image_format': args.image_format,
+        'image_quality': args.image_quality,
+        'asset_mode': args.assets,
+        'merge_mode': args.merge_mode,
+        'engine': args.engine,
+        'max_depth': args.max_depth,
+        'include': args.include,
+        'exclude': args.exclude,
+        'categories': args.categories,
+        'discovery_cache': not args.no_discovery_cache,
+        'optimize_pdf': args.optimize_pdf,
+        'backend': args.backend,
+        'highlight_limit_kb': args.highlight_limit,
+        'page_timeout': args.page_timeout,
+        'retries': args.retries,
+        'git_changes': args.git_changes,
+        'prepare_workers': args.prepare_workers,
+        'split_by': args.split_by,
+        'volume_limit': args.volume_limit,
+    }
+
+
+async def run_via_server(args):
+    """Надсилає збірку серверу (--connect) і виводить події по мірі готовності"""
+    request = {
+        'type': 'repo',
+        'repo_path': os.path.abspath(args.repo_path),
+        'output_dir': os.path.abspath(args.output_dir),
+        'options': converter_options(args),
+    }
+    ok = True
+    try:
+        async for header, _ in request_conversion(request, socket_path=args.socket, port=args.port):
+            if header['event'] == 'result':
+                mark = "✅" if header['ok'] else "❌"
+                print(f"{mark} {header['challenge']}")
+            elif header['event'] == 'done':
+                print(f"\n🎉 Готово: {len(header['pdfs'])} PDF")
+                if header.get('merged'):
+                    print(f"🔗 Об'єднаний PDF: {header['merged']}")
+            elif header['event'] == 'error':
+                print(f"❌ Помилка сервера: {header['message']}")
+                ok = False
+    except (OSError, asyncio.IncompleteReadError) as e:
+        address = f"127.0.0.1:{args.port}" if args.port else args.socket
+        print(f"❌ Не вдалося зв'язатися з сервером {address}: {e}")
+        print("💡 Запусти сервер: python3 main.py --serve")
+        return False
+    return ok
+
+
 async def main():
-    if len(sys.argv) < 3:
-        print("Використання:")
-        print("python3 main.py <шлях_до_репозиторію> <папка_для_PDF>")
-        print("\nПриклади:")
-        print("python3 main.py /Users/username/cyber-apocalypse-2025/forensics/ writeups_1")
-        print("python3 main.py /Users/username/business-ctf-2025/forensics my_writeups")
-        sys.exit(1)
+    args = parse_args()
+
+    if args.connect:
+        if not await run_via_server(args):
+            sys.exit(1)
+        return
 
     # Перевіряємо залежності
-    if not check_dependencies():
+    if not check_dependencies(args.backend, args.engine, args.split_by):
         sys.exit(1)
 
-    repo_path = sys.argv[1]
-    output_dir = sys.argv[2]
+    if args.serve:
+        server = ConversionServer(
+            socket_path=args.socket, port=args.port, browsers=args.browsers
+        )
+        await server.serve_forever()
+        return
+
+    repo_path = args.repo_path
+    output_dir = args.output_dir
 
     if not os.path.exists(repo_path):
         print(f"❌ Шлях не існує: {repo_path}")
@@ -626,9 +4055,32 @@ async def main():
     print(f"📂 Вхідна папка: {repo_path}")
     print(f"📁 Вихідна папка: {output_dir}")
 
-    converter = CTFWriteupConverter(repo_path, output_dir)
-    await converter.run()
+    converter = CTFWriteupConverter(repo_path, output_dir, shards=args.shards, stats_path=args.stats,
+                                     **converter_options(args))
+    profiler = cProfile.Profile() if args.profile else None
+    if args.tracemalloc:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+
+    # У режимі --watch звіти виводяться після зупинки (Ctrl+C)
+    try:
+        if args.watch:
+            await converter.watch()
+        else:
+            await converter.run()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"\n🔬 Профіль збережено: {args.profile} (процеси --shards не профілюються)")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        if args.tracemalloc:
+            print_tracemalloc_report()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Зупинено")